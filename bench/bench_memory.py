@@ -0,0 +1,85 @@
+"""
+Measure the memory held by the GDTapes (and some tracks) of a full archive load.
+
+    python bench/bench_memory.py --collections GratefulDead,etree
+
+Tapes are built from the ids files in dbpath. Collections which have no ids files there are filled with
+synthetic rows, so that the numbers can be compared between versions of Archivary.py without a network.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from timemachine import Archivary
+from timemachine import config
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--dbpath", type=str, default=os.path.join(Archivary.ROOT_DIR, "metadata"), help="path to the ids")
+parser.add_argument("--collections", type=str, default="GratefulDead,etree", help="comma-separated collections")
+parser.add_argument("--n_synthetic", type=int, default=150000, help="synthetic tapes per missing collection")
+parser.add_argument("--n_track_tapes", type=int, default=500, help="tapes to give 20 tracks each")
+parms = parser.parse_args()
+
+FORMATS = ["VBR MP3", "Ogg Vorbis", "Flac", "Metadata", "Text", "Checksums", "JPEG", "Columbia Peaks", "PNG"]
+
+
+def synthetic_rows(collection, n):
+    random.seed(1)
+    rows = []
+    for i in range(n):
+        date = datetime.date(random.randint(1965, 2020), random.randint(1, 12), random.randint(1, 28)).isoformat()
+        colls = [collection, "etree"] + (["stream_only"] if random.random() < 0.1 else [])
+        rows.append(
+            {
+                "identifier": f"{collection.lower()}{date}.sbd.taper.{i}.flac16",
+                "date": date + "T00:00:00Z",
+                "avg_rating": round(random.random() * 5, 2),
+                "num_reviews": random.randint(1, 20),
+                "downloads": random.randint(1, 100000),
+                "addeddate": f"20{random.randint(10, 23)}-0{random.randint(1, 9)}-1{random.randint(0, 9)}T12:00:00Z",
+                "format": random.sample(FORMATS, k=5),
+                "collection": colls,
+            }
+        )
+    return rows
+
+
+def load_rows(collection):
+    paths = sorted(glob.glob(os.path.join(parms.dbpath, f"{collection}_ids", "*.json")))
+    if len(paths) == 0:
+        print(f"{collection}: no ids in {parms.dbpath}, using {parms.n_synthetic} synthetic rows")
+        return synthetic_rows(collection, parms.n_synthetic)
+    return [row for path in paths for row in json.load(open(path, "r"))]
+
+
+def track_dict(identifier, i):
+    name = f"{identifier}d1t{i:02d}.ogg"
+    return {"name": name, "original": name, "source": "original", "format": "Ogg Vorbis", "size": "1000000", "title": "Song"}
+
+
+config.load_options()
+collection_list = parms.collections.split(",")
+set_data = Archivary.GDSetBreaks(collection_list)
+rows = [row for c in collection_list for row in load_rows(c)]
+
+tracemalloc.start()
+start = time.time()
+before = tracemalloc.take_snapshot()
+tapes = [Archivary.GDTape(parms.dbpath, row, set_data, collection_list) for row in rows]
+tape_bytes = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+tape_seconds = time.time() - start
+
+before = tracemalloc.take_snapshot()
+track_tapes = tapes[: parms.n_track_tapes]
+tracks = [Archivary.GDTrack(track_dict(t.identifier, i), t.identifier) for t in track_tapes for i in range(20)]
+track_bytes = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+tracemalloc.stop()
+
+print(f"{len(tapes)} tapes: {tape_bytes / 2**20:.1f} MB, {tape_bytes / len(tapes):.0f} bytes/tape, {tape_seconds:.1f}s")
+print(f"{len(tracks)} tracks: {track_bytes / 2**20:.1f} MB, {track_bytes / len(tracks):.0f} bytes/track")
@@ -0,0 +1,91 @@
+"""
+Measure the time taken to turn archive.org metadata responses into the tracks of GDTapes.
+
+    python bench/bench_metadata.py --corpus ~/ia_metadata
+
+The corpus is a directory of recorded responses of https://archive.org/metadata/<identifier>, saved as
+<identifier>.json (sub-directories are searched too, so the json tree of older versions of the player can be used).
+Without a corpus, synthetic multi-format responses are used, so that the numbers can be compared between versions of
+Archivary.py without a network.
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import tempfile
+import time
+
+from timemachine import Archivary
+from timemachine import config
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--corpus", type=str, default=None, help="directory of archive.org metadata responses")
+parser.add_argument("--n_synthetic", type=int, default=200, help="synthetic responses, if there is no corpus")
+parser.add_argument("--n_tracks", type=int, default=40, help="tracks in each synthetic response")
+parser.add_argument("--repeat", type=int, default=5, help="times to parse each response")
+parser.add_argument("--lossless", type=int, default=0, help="play lossless formats")
+parms = parser.parse_args()
+
+FORMATS = [("ogg", "Ogg Vorbis"), ("mp3", "VBR MP3"), ("64kb.mp3", "MP3"), ("png", "PNG"), ("afpk", "Columbia Peaks")]
+
+
+def synthetic_response(i):
+    random.seed(i)
+    identifier = f"gd1977-05-08.sbd.synthetic.{i}"
+    files = []
+    order = list(range(1, parms.n_tracks + 1))
+    random.shuffle(order)
+    for n in order:
+        base = f"gd77-05-08d{1 + n // 20}t{n:02d}"
+        files.append({"name": f"{base}.flac", "source": "original", "format": "Flac", "size": "30000000", "track": str(n)})
+        files[-1]["title"] = f"{base} Song {n}.flac" if random.random() < 0.3 else f"Song {n}"
+        for ext, fmt in random.sample(FORMATS, k=4):
+            derivative = {"name": f"{base}.{ext}", "original": f"{base}.flac", "source": "derivative", "format": fmt}
+            files.append(dict(derivative, size="1000000"))
+    files.append({"name": f"{identifier}.txt", "source": "original", "format": "Text", "size": "1000"})
+    return identifier, {"files": files, "metadata": {"venue": "Barton Hall", "coverage": "Ithaca, NY"}, "created": 0}
+
+
+def load_corpus():
+    if parms.corpus is None:
+        print(f"no corpus, using {parms.n_synthetic} synthetic responses of {parms.n_tracks} tracks")
+        return [synthetic_response(i) for i in range(parms.n_synthetic)]
+    paths = sorted(glob.glob(os.path.join(os.path.expanduser(parms.corpus), "**", "*.json"), recursive=True))
+    responses = [(os.path.basename(path)[: -len(".json")], json.load(open(path, "r"))) for path in paths]
+    return [(identifier, page_meta) for identifier, page_meta in responses if "files" in page_meta]
+
+
+def tape_row(identifier):
+    row = {"identifier": identifier, "date": "1977-05-08", "addeddate": "2004-01-01T12:00:00Z", "format": ["VBR MP3"]}
+    return dict(row, collection=["GratefulDead"])
+
+
+config.load_options()
+config.optd["PLAY_LOSSLESS"] = bool(parms.lossless)
+responses = load_corpus()
+set_data = Archivary.GDSetBreaks([])
+tapes = [Archivary.GDTape("", tape_row(identifier), set_data, ["GratefulDead"]) for identifier, _ in responses]
+n_files = sum(len(page_meta["files"]) for _, page_meta in responses)
+
+start = time.time()
+for i in range(parms.repeat):
+    tracks = [tape.parse_files(page_meta["files"]) for tape, (_, page_meta) in zip(tapes, responses)]
+parse_seconds = (time.time() - start) / parms.repeat
+n_tracks = sum(len(x) for x in tracks)
+
+with tempfile.TemporaryDirectory() as dbpath:  # the whole of get_metadata, from a metadata store
+    store = Archivary.metadata_store(dbpath)
+    for identifier, page_meta in responses:
+        store.put(identifier, page_meta, commit=False)
+    store.db.commit()
+    tapes = [Archivary.GDTape(dbpath, tape_row(identifier), set_data, ["GratefulDead"]) for identifier, _ in responses]
+    start = time.time()
+    for tape in tapes:
+        tape.get_metadata()
+    metadata_seconds = time.time() - start
+
+print(f"{len(responses)} responses, {n_files} files, {n_tracks} tracks")
+print(f"parse_files: {1000 * parse_seconds / len(responses):.2f} ms/tape, {1e6 * parse_seconds / n_files:.1f} us/file")
+print(f"get_metadata: {1000 * metadata_seconds / len(responses):.2f} ms/tape")
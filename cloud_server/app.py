@@ -97,7 +97,7 @@ def get_all_tapes(date):
         print(f"Need to add collection {colls_to_add}")
         config.optd["COLLECTIONS"] = config.optd["COLLECTIONS"] + colls_to_add
         aa = Archivary.Archivary(collection_list=config.optd["COLLECTIONS"])
-    tapes = aa.tape_dates[date]
+    tapes = [x for x in aa.tape_dates[date] if not x._remove_from_archive]  # skip tapes known to be bad
     get_anything = True
     tape_collections = []
     t = []
@@ -199,6 +199,12 @@ def tape_ids(date):
     return dict(zip(collections, tape_ids))
 
 
+@app.route("/song_dates/<song>")
+def song_dates(song):
+    """The dates with tapes on which song was played"""
+    return {"song": song, "dates": aa.song_dates(song)}
+
+
 @app.route("/vcs/<collection>")
 def vcs(collection):
     """
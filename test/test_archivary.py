@@ -1,7 +1,13 @@
+import datetime
+import difflib
+import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from threading import Event
 
+import pytest
+
 from timemachine import Archivary
 from timemachine import config
 from timemachine import GD
@@ -145,8 +151,547 @@ def test_archivary_local_archive_missing_collection():
 #    assert False
 
 
-def test_gd():
-    gd = Archivary.GDArchive()
+IDS_ROWS = [
+    {
+        "identifier": "gd1977-05-08.sbd.miller",
+        "date": "1977-05-08T00:00:00Z",
+        "avg_rating": 4.5,
+        "num_reviews": 10,
+        "downloads": 1000,
+        "addeddate": "2004-01-01T12:00:00Z",
+        "format": ["Flac", "VBR MP3"],
+        "collection": ["GratefulDead", "etree"],
+    },
+    {
+        "identifier": "gd1977-05-08.aud.unknown",
+        "date": "1977-05-08T00:00:00Z",
+        "avg_rating": 3.0,
+        "num_reviews": 2,
+        "downloads": 10,
+        "addeddate": "2008-01-01T12:00:00Z",
+        "format": ["VBR MP3"],
+        "collection": ["GratefulDead", "etree"],
+    },
+    {
+        "identifier": "phil1977-05-09.aud",
+        "date": "1977-05-09",
+        "addeddate": "2010-01-01T12:00:00Z",
+        "format": ["Ogg Vorbis"],
+        "collection": ["PhilLeshandFriends"],
+    },
+]
+
+
+def write_ids(dbpath, collection, period, rows=IDS_ROWS):
+    ids_dir = os.path.join(dbpath, f"{collection}_ids")
+    os.makedirs(ids_dir, exist_ok=True)
+    chunk_path = os.path.join(ids_dir, f"ids_{period}.json")
+    json.dump(rows, open(chunk_path, "w"))
+    return chunk_path
+
+
+@pytest.fixture
+def dbpath(tmp_path, monkeypatch):
+    """A dbpath with the GratefulDead ids of IDS_ROWS, and a registry with no tapes left from other tests"""
+    monkeypatch.setattr(Archivary, "TAPES", Archivary.TapeRegistry())
+    write_ids(str(tmp_path), "GratefulDead", 1970)
+    return str(tmp_path)
+
+
+def test_tape_index(tmp_path):
+    chunk_path = write_ids(str(tmp_path), "GratefulDead", 1970)
+    index = Archivary.TapeIndex.load(chunk_path)
+    assert len(index) == 3
+    assert index.max_addeddate() == "2010-01-01T12:00:00Z"
+    row = index.row(0)
+    assert row["identifier"] == "gd1977-05-08.sbd.miller"
+    assert row["date"] == "1977-05-08"
+    assert row["collection"] == ["GratefulDead", "etree"]
+    assert sorted(row["format"]) == ["Flac", "VBR MP3"]
+    assert [r["identifier"] for r in index.rows(["PhilLeshandFriends"])] == ["phil1977-05-09.aud"]
+    assert index.row_numbers(["etree"]) == [0, 1]
+    assert index.row_numbers(["PhilLeshandFriends", "GratefulDead"]) == [0, 1, 2]
+    assert index.row_numbers(["JJJJJXX_ASDF"]) == []
+
+
+def test_lazy_tapes(dbpath):
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    assert gd.dates == ["1977-05-08"]
+    assert len(gd._tapes_by_id) == 0  # nothing is built until it is used
+    tapes = gd.tape_dates["1977-05-08"]
+    assert len(tapes) == 2
+    assert isinstance(tapes[0], Archivary.GDTape)
+    assert tapes[0].identifier == "gd1977-05-08.sbd.miller"
+    assert len(gd._tapes_by_id) == 2
+
+
+def test_compact_tapes(dbpath):
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    sbd, aud = gd.tape_dates["1977-05-08"][:2]
+    assert not hasattr(sbd, "__dict__")
+    assert sbd.collection == IDS_ROWS[0]["collection"]
+    assert sbd._collection_ids is aud._collection_ids  # equal collections share one tuple of ids
+    assert sorted(sbd.format) == sorted(IDS_ROWS[0]["format"])
+    assert sbd.contains_sound()
+    assert sbd.url_metadata == "https://archive.org/metadata/gd1977-05-08.sbd.miller"
+
+    formats = Archivary.NameTable(Archivary.MASK_FORMATS)
+    mask = formats.mask(["VBR MP3"] + [f"Format {i}" for i in range(100)])  # free-form formats share the "Other" bit
+    assert mask < 2 ** len(formats.names) and formats.from_mask(mask) == ["VBR MP3", "Other"]
+
+
+def test_tape_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(Archivary, "TAPES", Archivary.TapeRegistry())  # no tapes left from other tests
+    iddir = os.path.join(str(tmp_path), "GratefulDead_ids")
+    downloader = Archivary.IATapeDownloader()
+    assert downloader.store_metadata(iddir, IDS_ROWS[:2]) == 2
+    new_row = dict(IDS_ROWS[0], identifier="gd1977-05-08.sbd.new", addeddate="2020-01-01T12:00:00Z")
+    changed_row = dict(IDS_ROWS[1], downloads=5000)
+    assert downloader.store_metadata(iddir, [changed_row, new_row]) == 1
+    assert downloader.store_metadata(iddir, [new_row]) == 0
+    assert json.load(open(os.path.join(iddir, "ids_1970.json"))) == IDS_ROWS[:2]  # the period file is untouched
+
+    gd = Archivary.GDArchive(dbpath=str(tmp_path), collection_list=["GratefulDead"])
+    tapes = {t.identifier: t for t in gd.tape_dates["1977-05-08"]}
+    assert len(tapes) == 3
+    assert tapes["gd1977-05-08.aud.unknown"].downloads == 5000
+
+    assert downloader.compact_journal(iddir)
+    assert not os.path.exists(Archivary.TapeJournal.path(iddir))
+    rows = {x["identifier"]: x for x in json.load(open(os.path.join(iddir, "ids_1970.json")))}
+    assert len(rows) == 3 and rows["gd1977-05-08.aud.unknown"]["downloads"] == 5000
+
+
+def test_parallel_load(dbpath, monkeypatch):
+    pools = []
+
+    class Pool(ThreadPoolExecutor):
+        def __init__(self, max_workers, mp_context):
+            pools.append(mp_context.get_start_method())
+            super().__init__(max_workers)
+
+    monkeypatch.setattr(Archivary, "ProcessPoolExecutor", Pool)
+    write_ids(dbpath, "GratefulDead", 1980, [dict(IDS_ROWS[0], identifier="gd1981-01-01", date="1981-01-01")])
+    parallel = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"], n_load_workers=2)
+    assert len(pools) == 1 and pools[0] != "fork"  # the indexes were built in the pool
+    serial = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"], n_load_workers=1)
+    assert parallel.dates == serial.dates == ["1977-05-08", "1981-01-01"]
+    assert [t.identifier for t in parallel.tapes.refs()] == [t.identifier for t in serial.tapes.refs()]
+    Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"], n_load_workers=2)
+    assert len(pools) == 1  # the indexes are current, so no pool is started
+
+
+def test_iter_json_array(tmp_path):
+    chunk_path = write_ids(str(tmp_path), "GratefulDead", 1970)
+    assert list(Archivary.iter_json_array(chunk_path, chunk_size=7)) == IDS_ROWS
+
+
+def test_paged_years(dbpath, monkeypatch):
+    monkeypatch.setenv("HOME", dbpath)
+    open(os.path.join(dbpath, ".etree_collection_names.json"), "w").write("{}")
+    for year in range(1976, 1981):
+        row = dict(IDS_ROWS[0], identifier=f"etree{year}-05-08", date=f"{year}-05-08", collection=["etree"])
+        write_ids(dbpath, "etree", year, [row])
+    kwargs = dict(dbpath=dbpath, collection_list=["etree"], date_range=[1976, 1980])
+    etree = Archivary.GDArchive(paged=True, **kwargs)
+    assert len(etree.dates) == 5 and etree.year_list() == [1976, 1977, 1978, 1979, 1980]  # every year is indexed
+
+    etree.tape_dates["1976-05-08"][0]
+    etree.ensure_year(1979)
+    prefetcher = etree._prefetcher
+    if prefetcher is not None:
+        prefetcher.join()
+    assert sorted(etree._shards) == ["1978", "1979", "1980"]  # only the tapes around the year are built
+    assert len(etree.dates) == 5 and etree.tape_dates["1976-05-08"][0].identifier == "etree1976-05-08"
+    assert "1976" in etree._shards
+
+    unpaged = Archivary.GDArchive(**kwargs)
+    unpaged.ensure_year(1979)
+    assert unpaged._prefetcher is None and len(unpaged._shards) == 0  # paging is off by default
+
+
+def test_memory_budget(dbpath):
+    write_ids(dbpath, "GratefulDead", 1980, [dict(IDS_ROWS[0], identifier="gd1981-01-01", date="1981-01-01")])
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    gd.tape_budget = 1  # byte: keep only the current year
+    sbd = gd.tape_dates["1977-05-08"][0]
+    assert gd.memory_stats()["resident_tapes"] == 2
+    assert gd.tape_dates["1981-01-01"][0].identifier == "gd1981-01-01"
+    stats = gd.memory_stats()
+    assert stats["resident_tapes"] == 1 and stats["evicted_shards"] == 1
+    assert stats["resident_bytes"] == Archivary.RESIDENT_TAPE_BYTES
+
+    tapes = gd.tape_dates["1977-05-08"]  # from the refs, in the same order
+    assert tapes[0] is sbd  # still in use, so it is found in the registry
+    assert tapes[1].identifier == "gd1977-05-08.aud.unknown"
+    assert gd.memory_stats()["evicted_shards"] == 2
+
+    write_ids(dbpath, "GratefulDead", 1990, [dict(IDS_ROWS[0], identifier="gd1990-01-01", date="1990-01-01")])
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    gd.tape_budget = 2 * Archivary.RESIDENT_TAPE_BYTES
+    gd.tape_dates["1981-01-01"][0]  # the current year
+    for ref in gd._date_refs["1977-05-08"] + gd._date_refs["1990-01-01"]:  # built as the prefetcher does, without a touch
+        gd.build_tape(ref)
+    assert sorted(gd._shards) == ["1981", "1990"]  # checked after each build, so 1977 is dropped
+    assert gd.memory_stats()["resident_bytes"] == gd._resident_bytes == 2 * Archivary.RESIDENT_TAPE_BYTES
+
+
+def test_tape_registry(dbpath, monkeypatch):
+    monkeypatch.setenv("HOME", dbpath)
+    open(os.path.join(dbpath, ".etree_collection_names.json"), "w").write("{}")
+    write_ids(dbpath, "GratefulDead", 1977, IDS_ROWS[:2])
+    write_ids(dbpath, "etree", 1977, IDS_ROWS[:2])  # the same items, in two collections
+    kwargs = dict(dbpath=dbpath, collection_list=["GratefulDead", "etree"], date_range=[1977, 1977])
+    gd = Archivary.GDArchive(**kwargs)
+    tapes = gd.tape_dates["1977-05-08"]
+    assert [t.identifier for t in tapes] == [x["identifier"] for x in IDS_ROWS[:2]]
+    assert Archivary.TAPES.folded == 2
+
+    other = Archivary.GDArchive(**kwargs)
+    assert other.tape_dates["1977-05-08"][0] is tapes[0]  # one tape object (and metadata) per identifier
+    assert Archivary.TAPES.get(tapes[1].identifier, gd.tape_scope) is tapes[1]
+
+    reordered = Archivary.GDArchive(**dict(kwargs, collection_list=["etree", "GratefulDead"]))
+    tape = reordered.tape_dates["1977-05-08"][0]
+    assert tape is not tapes[0]  # the collections of an archive give its tapes their artist
+    assert (tape.artist, tapes[0].artist) == ("etree", "GratefulDead")
+
+
+def test_score_engine(dbpath, monkeypatch):
+    monkeypatch.setattr(Archivary, "SCORES", Archivary.ScoreEngine())
+    scores_path = os.path.join(dbpath, Archivary.ScoreEngine.FILENAME)
+    lines = [json.dumps({"identifier": "gd1977-05-08.sbd.miller", "meta": x}) + "\n" for x in (5.0, -20.0)]
+    open(scores_path, "w").write("".join(lines))
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    assert open(scores_path).readlines() == lines[1:]  # compacted to the latest score
+    assert not os.path.exists(os.path.join(dbpath, Archivary.MetadataStore.FILENAME))  # opened when first used
+    assert gd.bad_tapes == {}  # as the first tape would
+
+    def no_filesystem(path):
+        raise AssertionError(f"looked for {path}")
+
+    with monkeypatch.context() as m:
+        m.setattr(os.path, "exists", no_filesystem)
+        tapes = list(gd.tape_dates["1977-05-08"])
+    assert [t.identifier for t in tapes] == ["gd1977-05-08.aud.unknown", "gd1977-05-08.sbd.miller"]
+
+    monkeypatch.setitem(config.optd, "FAVORED_TAPER", {"miller": 30})
+    assert tapes[1].compute_score() > tapes[0].compute_score()  # rescored when the options change
+
+    tapes[0]._tracks = []
+    Archivary.SCORES.record_meta(tapes[0])
+    Archivary.SCORES.record_meta(tapes[0])
+    assert len(open(scores_path).readlines()) == 2  # recorded only when the score changes
+
+
+def test_taper_matcher():
+    matcher = Archivary.TaperMatcher(["Miller", "mill", "ller", "charlie"])
+    assert matcher.match("gd1977-05-08.sbd.miller.1234") == {"miller", "mill", "ller"}
+    assert matcher.match("gd1977-05-08.aud.charliemiller") == {"miller", "mill", "ller", "charlie"}
+    assert matcher.match("gd1977-05-08.aud.unknown") == set()
+
+
+def test_merged_date_index(dbpath):
+    write_ids(dbpath, "GratefulDead", 1970, IDS_ROWS[:2])
+    write_ids(dbpath, "PhilLeshandFriends", 1970, IDS_ROWS[1:])
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    phil = Archivary.GDArchive(dbpath=dbpath, collection_list=["PhilLeshandFriends"])
+    ordered = []
+
+    def order(tapes):
+        ordered.append(len(tapes))
+        return tapes
+
+    index = Archivary.MergedDateIndex([gd, phil], order=order)
+    index.refresh()
+    assert sorted(index) == ["1977-05-08", "1977-05-09"] and ordered == []
+    tapes = index["1977-05-08"]
+    assert len(tapes) == 2 and ordered == []  # nothing is sorted until the tapes are read
+    assert [t.identifier for t in tapes] == [x["identifier"] for x in IDS_ROWS[:2]]
+    assert ordered == [2] and index["1977-05-08"] is tapes
+    phil_tapes = index["1977-05-09"]
+
+    gd.load_archive()  # an update which changes nothing keeps the ordered lists
+    index.refresh()
+    assert index["1977-05-08"] is tapes
+    gd._date_refs["1977-05-08"] = gd._date_refs["1977-05-08"][:1]
+    gd.get_tape_dates()
+    index.refresh()
+    assert len(index["1977-05-08"]) == 1 and index["1977-05-09"] is phil_tapes
+
+
+def test_calendar_index(dbpath):
+    write_ids(dbpath, "GratefulDead", 1980, [dict(IDS_ROWS[0], identifier="gd1981-01-01", date="1981-01-01")])
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    calendar = Archivary.CalendarIndex(gd.dates, gd.tape_dates, gd.year_list())
+    assert calendar.years == [1977, 1981]
+    assert calendar.next_date(datetime.date(1977, 5, 8)) == datetime.date(1981, 1, 1)
+    assert calendar.next_date(datetime.date(1981, 1, 1)) == datetime.date(1977, 5, 8)  # wraps around
+    assert calendar.previous_date(datetime.date(1980, 1, 1)) == datetime.date(1977, 5, 8)
+    assert list(calendar.dates_after(datetime.date(1978, 1, 1))) == ["1981-01-01", "1977-05-08"]
+    artists = calendar.artists("1977-05-08")
+    assert artists == ["GratefulDead"] and calendar.artists("1977-05-08") is artists
+    assert calendar.artists("1977-05-09") == []
+    for tape in gd.tape_dates["1977-05-08"]:
+        tape._remove_from_archive = True
+    assert calendar.artists("1977-05-08") == ["GratefulDead"]  # remembered until forgotten
+    calendar.forget("1977-05-08")
+    assert calendar.artists("1977-05-08") == []
+    assert calendar.years_on(5, 8) == [1977] and calendar.years_on(5, 9) == []
+    assert calendar.next_year_on(5, 8, 1977) == 1977  # wraps around to the only year
+    assert calendar.next_year_on(1, 1, 1960) == 1981 and calendar.next_year_on(1, 2, 1960) is None
+
+
+def test_artist_index(dbpath):
+    write_ids(dbpath, "GratefulDead", 1970, IDS_ROWS[:2])
+    write_ids(dbpath, "PhilLeshandFriends", 1970, IDS_ROWS[2:])
+    write_ids(dbpath, "PhilLeshandFriends", 1980, [dict(IDS_ROWS[2], identifier="phil1981-01-01", date="1981-01-01")])
+    ia = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead", "PhilLeshandFriends"])
+    index = ia.artist_index
+    assert index.dates("PhilLeshandFriends") == ["1977-05-09", "1981-01-01"]
+    assert index.next_date("PhilLeshandFriends", "1977-05-09") == "1981-01-01"
+    assert index.next_date("PhilLeshandFriends", "1981-01-01") == "1977-05-09"  # wraps around
+    assert index.next_date("GratefulDead", "1977-05-08") == "1977-05-08"
+    assert index.next_date("Phish", "1977-05-08") is None
+    assert [t.identifier for t in index.between("1977", "1977-99")["GratefulDead"]] == [x["identifier"] for x in IDS_ROWS[:2]]
+    assert [t.artist for t in ia.tape_dates["1977-05-09"]] == ["PhilLeshandFriends"]  # the same rule as the tapes
+
+    ia.set_date_refs({k: v for k, v in ia._date_refs.items() if k != "1981-01-01"})  # only the changed dates are indexed
+    assert index.dates("PhilLeshandFriends") == ["1977-05-09"]
+
+    ia.tape_dates["1977-05-09"][0]._remove_from_archive = True
+    ia.resort_tape_date("1977-05-09")
+    assert index.next_date("PhilLeshandFriends", "1977-05-08") is None  # the removed tape is dropped from the index
+    index.clear()
+    ia.get_tape_dates()
+    assert index.dates("GratefulDead") == ["1977-05-08"] and index.dates("PhilLeshandFriends") == ["1977-05-09"]
+
+    row = dict(IDS_ROWS[0], collection=["georgeblood"])
+    rows = [dict(row, identifier=f"78_song-{i}_bing-crosby-orchestra_gbia{i}", date=f"1940-0{i + 1}-01") for i in range(3)]
+    rows.append(dict(row, identifier="78_no-performer", date="1940-05-01"))
+    write_ids(dbpath, "georgeblood", 1940, rows)
+    gb = Archivary.GDArchive(dbpath=dbpath, collection_list=["georgeblood"], date_range=1940)
+    artist_tapes = gb.year_artists(1940)
+    assert list(artist_tapes) == ["bing crosby"] and isinstance(artist_tapes["bing crosby"], list)
+    assert [t.identifier for t in artist_tapes["bing crosby"]] == [x["identifier"] for x in rows[:3]]
+    assert gb.year_artists(1941) == {}
+
+
+def test_song_index(dbpath, monkeypatch):
+    monkeypatch.setattr(Archivary, "SONGS", Archivary.SongIndex())
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    tape = gd.tape_dates["1977-05-08"][0]
+    titles = ["Dark Star ->", "St. Stephen", "Dark Star"]
+    track = dict(source="original", format="Ogg Vorbis", size="1000")
+    files = [dict(track, name=f"t{i}.ogg", original=f"t{i}.ogg", title=x) for i, x in enumerate(titles)]
+    Archivary.metadata_store(dbpath).put(tape.identifier, {"files": files, "metadata": {}})
+    tape.get_metadata()
+    occurrences = [x for x in Archivary.SONGS.occurrences("dark  STAR") if x[1] == tape.identifier]
+    assert occurrences == [("1977-05-08", tape.identifier, 0), ("1977-05-08", tape.identifier, 2)]
+    assert ("1968-01-20", "GratefulDead", "Set 1") in Archivary.SONGS.occurrences("Dark Star")  # from the set lists
+
+    songs = Archivary.SongIndex()  # the titles were recorded, so they are indexed without the metadata
+    songs.load(dbpath)
+    assert songs.dates("st stephen") == ["1977-05-08"] and songs.titles() == ["Dark Star", "St. Stephen"]
+
+
+def test_venue_index(tmp_path):
+    os.makedirs(os.path.join(str(tmp_path), "vcs"))
+    vcs = {"1977-05-08": "Barton Hall,Ithaca, NY"}
+    json.dump(vcs, open(os.path.join(str(tmp_path), "vcs", "GratefulDead_vcs.json"), "w"))
+    venues = Archivary.VenueIndex()
+    venues.load(str(tmp_path))
+    venues.add_set_rows(Archivary.GDSetBreaks([]).iter_rows())
+    assert venues.search("barton ith")["Barton Hall, Ithaca, NY"] == ["1977-05-08"]
+    assert "Barton Hall, Cornell University, Ithaca, NY" in venues.search("barton ith")  # from the set lists
+    assert "Winterland, San Francisco, CA" in venues.search("winterl san")
+    assert venues.search("winterland boston") == {} and venues.search("") == {}
+    assert "i" in venues.next_chars("w") and venues.next_chars("barto") == ["n"]
+
+
+def test_set_breaks_store(tmp_path):
+    open(os.path.join(str(tmp_path), "set_breaks.1.2.pickle"), "wb").close()  # from an older csv
+    store = Archivary.SetBreaksStore(cache_dir=str(tmp_path))
+    info = store.get_date("GratefulDead", "1977-05-08")
+    assert os.listdir(str(tmp_path)) == [os.path.basename(store.pickle_path)]  # compiled at first use
+    assert info.location == ("Barton Hall, Cornell University", "Ithaca", "NY") and info.n_sets == 3
+    assert store.get_date("GratefulDead", "1977-05-08") is info
+    assert store.get_date("GratefulDead", "1900-01-01") is store.get_date("Phish", "1977-05-08") is store.empty
+
+    compiled = Archivary.SetBreaksStore(cache_dir=str(tmp_path))
+    compiled.compile = None  # read from the pickle, without parsing the csv
+    assert compiled.rows == store.rows
+
+
+def test_timeline_index():
+    timeline = Archivary.TimelineIndex(["1966-03-12", "1977-05-08", "1977-05-09"], ["GratefulDead"])
+    seven = datetime.time(19, 0)
+    assert timeline.start("1966-03-12", seven) == datetime.datetime(1966, 3, 12, 21, 0)  # from the set data
+    assert timeline.start("1977-05-08", seven) == datetime.datetime(1977, 5, 8, 19, 0)
+    assert timeline.date_at(datetime.datetime(1966, 3, 12, 23, 59), seven) == "1966-03-12"
+    assert timeline.date_at(datetime.datetime(1966, 3, 13, 0, 30), seven) is None
+    assert timeline.date_at(datetime.datetime(1977, 5, 9, 21, 0), seven) == "1977-05-09"
+    assert timeline.date_at(datetime.datetime(1977, 5, 9, 21, 0), datetime.time(22, 0)) is None  # rebuilt
+
+    timeline = Archivary.TimelineIndex(["1977-05-08 early", "1977-05-08 late", "1977-05-08 night"], ["GratefulDead"])
+    timeline.set_start = {"1977-05-08 late": datetime.time(20, 0), "1977-05-08 night": datetime.time(21, 0)}.get
+    assert timeline.dates_at(datetime.datetime(1977, 5, 8, 21, 30), seven) == [
+        "1977-05-08 night",
+        "1977-05-08 late",
+        "1977-05-08 early",
+    ]
+    assert timeline.date_at(datetime.datetime(1977, 5, 8, 22, 30), seven) == "1977-05-08 night"
+    assert timeline.dates_at(datetime.datetime(1977, 5, 8, 22, 30), seven) == ["1977-05-08 night", "1977-05-08 late"]
+    assert timeline.dates_at(datetime.datetime(1977, 5, 8, 19, 0), seven) == ["1977-05-08 early"]  # starting at dt
+
+
+def test_metadata_store(tmp_path):
+    legacy_path = os.path.join(str(tmp_path), "1977", "5", "gd1977-05-08.sbd.miller.json")
+    os.makedirs(os.path.dirname(legacy_path))
+    files = [{"name": "t1.ogg", "source": "derivative", "format": "Ogg Vorbis", "size": "10", "md5": "x"}, {"format": "JPEG"}]
+    page_meta = {"files": files, "reviews": ["great"], "metadata": {"venue": "Barton Hall", "subject": "x"}}
+    json.dump(page_meta, open(legacy_path, "w"))
+    json.dump(page_meta, open(legacy_path.replace("miller", "other"), "w"))
+    store = Archivary.MetadataStore(str(tmp_path), quota_mb=1)
+    store.start_migration()
+    slim = {"files": files[:1], "metadata": {"venue": "Barton Hall"}}
+    slim["files"][0].pop("md5")
+    assert store.get("gd1977-05-08.sbd.miller") == slim  # moved from the json tree, without the unused fields
+    store._migrator.join()  # the rest are moved in the background
+    assert store.get("gd1977-05-08.sbd.other") == slim
+    assert not os.path.exists(os.path.join(str(tmp_path), "1977"))
+
+    accessed = "SELECT accessed FROM meta WHERE identifier = 'gd1977-05-08.sbd.miller'"
+    stamp = store.db.execute(accessed).fetchone()[0]
+    store.get("gd1977-05-08.sbd.miller")
+    assert store.db.execute(accessed).fetchone()[0] == stamp  # read times are written in batches
+    store.flush()
+    assert store.db.execute(accessed).fetchone()[0] > stamp
+
+    noise = [{"name": os.urandom(32).hex(), "source": "original"} for i in range(6000)]  # ~0.25MB compressed
+    for i in range(6):
+        store.put(f"tape{i}", {"files": noise})
+        store.get("gd1977-05-08.sbd.miller")
+    assert "gd1977-05-08.sbd.miller" in store and "tape0" not in store  # the least recently read is dropped
+    assert store.total_size() <= 2**20 and store.evicted > 0
+
+
+def test_negative_cache(dbpath, monkeypatch):
+    monkeypatch.setattr(Archivary, "META_STORES", {})
+    store = Archivary.metadata_store(dbpath)
+    track = dict(source="original", format="Ogg Vorbis", size="1000", name="t1.ogg", original="t1.ogg", title="Song")
+    store.put("gd1977-05-08.sbd.miller", {"metadata": {}})  # no files: this tape can not be played
+    store.put("gd1977-05-08.aud.unknown", {"files": [track], "metadata": {}})
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    assert [t.identifier for t in gd.resort_tape_date("1977-05-08")] == ["gd1977-05-08.aud.unknown"]
+    assert store.is_bad("gd1977-05-08.sbd.miller") and not store.is_bad("gd1977-05-08.aud.unknown")
+
+    monkeypatch.setattr(Archivary, "TAPES", Archivary.TapeRegistry())  # a restart
+    monkeypatch.setattr(Archivary, "META_STORES", {})
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    removed = {t.identifier: t._remove_from_archive for t in gd.tape_dates["1977-05-08"]}  # before any metadata is read
+    assert removed == {"gd1977-05-08.sbd.miller": True, "gd1977-05-08.aud.unknown": False}
+
+    store = Archivary.metadata_store(dbpath)
+    store.mark_bad("gd1977-05-08.sbd.miller", "no files", ttl_days=0)  # expired entries are tried again
+    assert not Archivary.MetadataStore(dbpath).is_bad("gd1977-05-08.sbd.miller")
+
+    monkeypatch.setitem(config.optd, "PLAY_LOSSLESS", False)
+    flac_only = Archivary.GDTape(dbpath, dict(IDS_ROWS[1], format=["Flac"]), gd.set_data, ["GratefulDead"])
+    flac_only.meta_loaded = True
+    assert flac_only.compute_score() == -1 and flac_only._remove_from_archive
+    assert not store.is_bad(flac_only.identifier)  # playable with PLAY_LOSSLESS, so not remembered
+
+
+def test_parse_files(monkeypatch):
+    monkeypatch.setitem(config.optd, "PLAY_LOSSLESS", False)
+    tape = Archivary.GDTape("", IDS_ROWS[0], Archivary.GDSetBreaks([]), ["GratefulDead"])
+    flac = dict(source="original", format="Flac", size="100")
+    derived = dict(source="derivative", size="10")
+    files = [
+        dict(derived, name="gd77d1t02.ogg", original="gd77d1t02.flac", format="Ogg Vorbis"),
+        dict(flac, name="gd77d1t02.flac", title="Scarlet Begonias.flac", track="2"),
+        dict(derived, name="gd77d1t02.mp3", original="gd77d1t02.flac", format="VBR MP3"),
+        dict(derived, name="gd77d1t01.mp3", original="gd77d1t01.flac", format="VBR MP3"),
+        dict(flac, name="gd77d1t01.flac", title="gd77-05-08 d1t01 New Minglewood Blues", track="1"),
+        dict(derived, name="_78_side_b.mp3", original="_78_side_b.flac", format="VBR MP3"),
+        dict(source="original", name="gd77.txt", format="Text"),
+    ]
+    tracks = tape.parse_files(files)
+    assert [(t.track, t.title) for t in tracks] == [(1, "New Minglewood Blues"), (2, "Scarlet Begonias")]
+    assert [f["format"] for f in tracks[1].files] == ["Ogg Vorbis", "VBR MP3"]  # ranked by format preference
+
+    encore = dict(source="original", format="VBR MP3", size="10", name="encore.mp3", original="encore.mp3", title="Encore")
+    tracks = tape.parse_files([encore] + files)
+    assert [t.track for t in tracks] == [1, 2, None]  # the unnumbered tracks go last
+
+
+def test_title_matcher():
+    titles = ["Scarlet Begonias >", "Fire on the Mountain", "set break", "Morning Dew", "Morning Dew", None]
+    matcher = Archivary.TitleMatcher(titles)
+    assert matcher.titles == ["Scarlet Begonias >", "Fire on the Mountain", "set break", "Morning Dew"]
+    assert matcher.close_matches("Scarlet Begonias")[0] == "Scarlet Begonias >"
+    assert matcher.close_matches("Set Break", cutoff=0.6) == ["set break"]
+    assert matcher.close_matches("Promised Land") == []
+    assert matcher.close_matches("Fire", cutoff=0.0)[0] == "Fire on the Mountain"
+
+    tlist = ["d1t12 Deal", "Dark Star", "Jack Straw", "Jam", "U.S. Blues", "Playin' in the Band", "Drums >", "Space"]
+    matcher = Archivary.TitleMatcher(tlist)
+    assert matcher.close_matches("Deal") == []  # no match, as with difflib
+    assert matcher.close_matches("Jam") == ["Jam"]  # a short title
+    for query in ["Deal", "Jam", "US Blues", "Playing in the Band", "Drums", "Space", "Set Break", "Sugaree"]:
+        assert matcher.close_matches(query) == difflib.get_close_matches(query, tlist)
+
+
+def test_break_map(dbpath, monkeypatch):
+    monkeypatch.setattr(Archivary, "META_STORES", {})
+    titles = ["Minglewood Blues", "Dancin' In The Streets", "Scarlet Begonias", "Morning Dew", "One More Saturday Night"]
+    track = dict(source="original", format="Ogg Vorbis", size="1000")
+    files = [dict(track, name=f"t{i}.ogg", original=f"t{i}.ogg", title=x) for i, x in enumerate(titles)]
+    store = Archivary.metadata_store(dbpath)
+    store.put("gd1977-05-08.sbd.miller", {"files": files, "metadata": {}})
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    tape = [t for t in gd.tape_dates["1977-05-08"] if t.identifier == "gd1977-05-08.sbd.miller"][0]
+    tape.get_metadata()
+    breaks = {"long": [2, 5], "short": [4], "location": [], "location2": None}
+    assert store.get_breaks(tape.identifier, tape.break_version()) == breaks
+    assert [t.title for t in tape.tracks()][2] == "Set Break"
+
+    def no_matching(self):
+        raise AssertionError("computed the breaks again")
+
+    monkeypatch.setattr(Archivary.GDTape, "_compute_breaks", no_matching)
+    monkeypatch.setattr(Archivary, "TAPES", Archivary.TapeRegistry())  # a restart
+    gd = Archivary.GDArchive(dbpath=dbpath, collection_list=["GratefulDead"])
+    tape = [t for t in gd.tape_dates["1977-05-08"] if t.identifier == "gd1977-05-08.sbd.miller"][0]
+    assert tape.venue(tracknum=6) == "Barton Hall, Cornell University, Ithaca, NY" and not tape.meta_loaded
+    assert len(tape.tracks()) == 7
+
+    assert store.get_breaks(tape.identifier, tape.break_version() + 1) is None  # the set data changed
+    version = tape.break_version()
+    monkeypatch.setitem(config.optd, "PLAY_LOSSLESS", not config.optd.get("PLAY_LOSSLESS"))
+    assert tape.break_version() != version  # the tracks are made from other formats
+    store.put(tape.identifier, {"files": files[:4], "metadata": {}})  # the metadata changed
+    assert store.get_breaks(tape.identifier, version) is None
+
+    class BadResponse:
+        status_code = 200
+        url = "https://archive.org/metadata/gd1977-05-08.aud.unknown"
+
+        def json(self):
+            raise ValueError("not json")
+
+    fetches = []
+    monkeypatch.setattr(Archivary.requests, "get", lambda url: fetches.append(url) or BadResponse())
+    tape = [t for t in gd.tape_dates["1977-05-08"] if t.identifier == "gd1977-05-08.aud.unknown"][0]
+    tape.insert_breaks()
+    assert len(fetches) == 1 and not tape.meta_loaded  # a failed download is not tried again for the breaks
+    assert tape.break_map() is None and len(fetches) == 2
+    assert store.db.execute("SELECT * FROM breaks WHERE identifier = ?", (tape.identifier,)).fetchone() is None
+
+
+def test_gd(tmp_path):
+    gd = Archivary.GDArchive(dbpath=str(tmp_path))
     tapedate = "1982-11-25"
     tapes = gd.tape_dates[tapedate]
     assert len(tapes) >= 5
@@ -154,8 +699,8 @@ def test_gd():
     assert len(gd_tape.tracks()) > 10
 
 
-def test_gd_plus():
-    gd = Archivary.GDArchive(collection_list=["GratefulDead", "PhilLeshandFriends"])
+def test_gd_plus(tmp_path):
+    gd = Archivary.GDArchive(dbpath=str(tmp_path), collection_list=["GratefulDead", "PhilLeshandFriends"])
     tape_dates = gd.tape_dates
     assert max(tape_dates.keys()) > "1996-01-01"
     assert min(tape_dates.keys()) < "1967-01-01"
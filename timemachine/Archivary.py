@@ -16,23 +16,38 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import abc
-import codecs
+import array
+import atexit
 import csv
 import datetime
 import difflib
+import heapq
 import json
 import logging
 import math
+import mmap
+import multiprocessing
 import os
+import pickle
 import random
 import re
 import requests
+import sqlite3
 import string
+import struct
+import sys
 import tempfile
 import time
-from threading import Event, Lock, Thread
-
-from operator import methodcaller
+import weakref
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Mapping, MutableSequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from threading import Event, Lock, RLock, Thread
+
+from operator import attrgetter, methodcaller
 from tenacity import retry
 from tenacity.stop import stop_after_delay
 from typing import Callable, Optional
@@ -98,43 +113,510 @@ def is_valid_iso_date(s):
         return False
 
 
+EPOCH = datetime.datetime(1970, 1, 1)
+YEARLY_COLLECTIONS = ["etree", "georgeblood"]  # collections stored in a file per year. Should this be in config?
+JSON_SEPARATORS = re.compile(r"[\s,]*")
+JSON_WHITESPACE = re.compile(r"\s*")
+
+
+def iter_json_array(path, chunk_size=2**16):
+    """Yield the items of the json array in path one at a time, without reading the whole file into memory"""
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buf = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            pos = JSON_SEPARATORS.match(buf, pos).end()
+            if pos < len(buf):
+                if not started:
+                    if buf[pos] != "[":
+                        raise ValueError(f"{path} does not hold a json array")
+                    started = True
+                    pos = pos + 1
+                    continue
+                if buf[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                    after = JSON_WHITESPACE.match(buf, end).end()
+                    if after < len(buf) and buf[after] in ",]":  # otherwise the item may be cut short. Read more.
+                        yield item
+                        pos = end
+                        continue
+                except ValueError:
+                    pass
+            if eof:
+                raise ValueError(f"{path} ended inside the json array")
+            chunk = f.read(chunk_size)
+            eof = chunk == ""
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+class TapeIndex:
+    """A compact, memory-mapped columnar snapshot of one ids_<period>.json chunk.
+
+    The snapshot lives next to the chunk as ids_<period>.idx, and is rebuilt whenever the chunk changes.
+    Rows are read in place from the mapped file, so loading a period does no json parsing.
+    Each collection also has a list of its rows, so selecting a few collections of etree only touches their rows.
+
+    Layout: a fixed header (magic, version, header length), a json header describing the string tables
+    and the byte offset of each column, then the 8-byte aligned columns themselves.
+    """
+
+    MAGIC = b"TMIX"
+    VERSION = 2
+    PREAMBLE = struct.Struct("<4sII")
+    MAX_FORMATS = 64  # the formats column is a 64-bit mask.
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = self.PREAMBLE.unpack_from(self._mm, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {self.VERSION} tape index")
+        start = self.PREAMBLE.size
+        self.header = json.loads(bytes(self._mm[start : start + header_len]).decode("utf-8"))
+        if self.header["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"{path} was written on a machine with a different byte order")
+        self.n_rows = self.header["n_rows"]
+        self.collections = self.header["collections"]
+        self.formats = self.header["formats"]
+        self._mv = memoryview(self._mm)
+        self._columns = {}
+        for name, (offset, typecode, count) in self.header["columns"].items():
+            nbytes = count * array.array(typecode).itemsize
+            self._columns[name] = self._mv[offset : offset + nbytes].cast(typecode)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __repr__(self):
+        return f"TapeIndex {self.path} with {self.n_rows} rows"
+
+    def close(self):
+        self._columns = {}
+        if getattr(self, "_mv", None) is not None:
+            self._mv.release()
+            self._mv = None
+        self._mm.close()
+
+    @staticmethod
+    def index_path(json_path):
+        return os.path.splitext(json_path)[0] + ".idx"
+
+    @classmethod
+    def build(cls, json_path, tapes=None):
+        """Write the index for json_path. If tapes is None, the chunk is streamed from json_path (twice)."""
+        source_stat = os.stat(json_path)
+        rows = (lambda: iter_json_array(json_path)) if tapes is None else (lambda: tapes)
+
+        collections = {}
+        format_counts = {}
+        for t in rows():
+            for c in t.get("collection", []):
+                collections.setdefault(c, len(collections))
+            for fmt in t.get("format", []):
+                format_counts[fmt] = format_counts.get(fmt, 0) + 1
+        # If there are ever more than MAX_FORMATS formats in a chunk, drop the rarest. Audio formats are never rare.
+        formats = sorted(format_counts, key=lambda x: -format_counts[x])[: cls.MAX_FORMATS]
+        format_bits = {fmt: 1 << i for i, fmt in enumerate(formats)}
+
+        id_offsets = array.array("I", [0])
+        id_heap = bytearray()
+        dates = array.array("I")
+        ratings = array.array("f")
+        num_reviews = array.array("I")
+        downloads = array.array("I")
+        addeddates = array.array("I")
+        format_masks = array.array("Q")
+        coll_offsets = array.array("I", [0])
+        coll_ids = array.array("H")
+        postings = {}
+        max_addeddate = None
+        for t in rows():
+            date = t["date"][0] if isinstance(t["date"], list) else t["date"]
+            try:
+                day = to_date(date[:10]).toordinal()
+            except (TypeError, ValueError):
+                logger.warning(f"Skipping tape {t.get('identifier')} with bad date {date} in {json_path}")
+                continue
+            id_heap.extend(t["identifier"].encode("utf-8"))
+            id_offsets.append(len(id_heap))
+            dates.append(day)
+            ratings.append(float(t.get("avg_rating", 2)))
+            num_reviews.append(int(t.get("num_reviews", 1)))
+            downloads.append(int(t.get("downloads", 1)))
+            addeddate = t.get("addeddate", "1990-01-01T00:00:00Z")
+            if addeddate.startswith("0000"):
+                addeddate = "1990-01-01T00:00:00Z"
+            max_addeddate = addeddate if max_addeddate is None else max(max_addeddate, addeddate)
+            addeddates.append(int((datetime.datetime.fromisoformat(addeddate[:19]) - EPOCH).total_seconds()))
+            mask = 0
+            for fmt in t.get("format", []):
+                mask = mask | format_bits.get(fmt, 0)
+            format_masks.append(mask)
+            row_colls = [collections[c] for c in t.get("collection", [])]
+            coll_ids.extend(row_colls)
+            coll_offsets.append(len(coll_ids))
+            for c in set(row_colls):
+                postings.setdefault(c, []).append(len(dates) - 1)
+        # The rows of each collection, so that a few collections can be selected without scanning every row.
+        post_offsets = array.array("I", [0])
+        post_rows = array.array("I")
+        for c in range(len(collections)):
+            post_rows.extend(postings.get(c, []))
+            post_offsets.append(len(post_rows))
+
+        column_data = [
+            ("id_offsets", id_offsets),
+            ("id_heap", array.array("B", bytes(id_heap))),
+            ("date", dates),
+            ("avg_rating", ratings),
+            ("num_reviews", num_reviews),
+            ("downloads", downloads),
+            ("addeddate", addeddates),
+            ("format", format_masks),
+            ("coll_offsets", coll_offsets),
+            ("coll_ids", coll_ids),
+            ("post_offsets", post_offsets),
+            ("post_rows", post_rows),
+        ]
+        header = {
+            "byteorder": sys.byteorder,
+            "n_rows": len(dates),
+            "source_mtime_ns": source_stat.st_mtime_ns,
+            "source_size": source_stat.st_size,
+            "max_addeddate": max_addeddate,
+            "collections": sorted(collections, key=collections.get),
+            "formats": formats,
+            "columns": {},
+        }
+        # The column offsets depend on the header length, so lay the columns out relative to the header first.
+        relative_offsets = []
+        position = 0
+        for name, col in column_data:
+            relative_offsets.append(position)
+            position = position + len(col) * col.itemsize
+            position = position + (-position) % 8
+        header_len = 0
+        while True:
+            data_start = cls.PREAMBLE.size + header_len
+            data_start = data_start + (-data_start) % 8
+            for (name, col), rel in zip(column_data, relative_offsets):
+                header["columns"][name] = [data_start + rel, col.typecode, len(col)]
+            header_bytes = json.dumps(header).encode("utf-8")
+            if len(header_bytes) <= header_len:
+                header_bytes = header_bytes.ljust(header_len)
+                break
+            header_len = len(header_bytes)
+
+        outpath = cls.index_path(json_path)
+        tmpfile = f"{outpath}.tmp"
+        try:
+            with open(tmpfile, "wb") as f:
+                f.write(cls.PREAMBLE.pack(cls.MAGIC, cls.VERSION, header_len))
+                f.write(header_bytes)
+                for name, col in column_data:
+                    f.write(b"\0" * (header["columns"][name][0] - f.tell()))
+                    f.write(col.tobytes())
+            os.replace(tmpfile, outpath)
+        except Exception:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+        logger.debug(f"wrote tape index {outpath} with {header['n_rows']} rows")
+        return outpath
+
+    @classmethod
+    def load(cls, json_path):
+        """Return the index for json_path, rebuilding it if it is missing or stale. Returns None on failure."""
+        path = cls.index_path(json_path)
+        index = None
+        try:
+            if os.path.exists(path):
+                index = cls(path)
+                if not index.is_current(json_path):
+                    index.close()
+                    index = None
+        except Exception as e:
+            logger.debug(f"tape index {path} is unreadable: {e}")
+            index = None
+        if index is None:
+            try:
+                cls.build(json_path)
+                index = cls(path)
+            except Exception as e:
+                logger.warning(f"Failed to build tape index for {json_path}: {e}")
+                return None
+        return index
+
+    @classmethod
+    def is_stale(cls, json_path):
+        """True if the index of json_path is missing, unreadable, or older than the chunk"""
+        try:
+            index = cls(cls.index_path(json_path))
+        except Exception:
+            return True
+        try:
+            return not index.is_current(json_path)
+        finally:
+            index.close()
+
+    def is_current(self, json_path):
+        try:
+            source_stat = os.stat(json_path)
+        except OSError:
+            return False
+        return (source_stat.st_mtime_ns == self.header["source_mtime_ns"]) and (source_stat.st_size == self.header["source_size"])
+
+    def max_addeddate(self):
+        return self.header["max_addeddate"]
+
+    def identifier(self, i):
+        offsets = self._columns["id_offsets"]
+        return bytes(self._columns["id_heap"][offsets[i] : offsets[i + 1]]).decode("utf-8")
+
+    def date(self, i):
+        return datetime.date.fromordinal(self._columns["date"][i]).isoformat()
+
+    def collection_ids(self, i):
+        offsets = self._columns["coll_offsets"]
+        return self._columns["coll_ids"][offsets[i] : offsets[i + 1]]
+
+    def collection(self, i):
+        return [self.collections[c] for c in self.collection_ids(i)]
+
+    def format(self, i):
+        mask = self._columns["format"][i]
+        return [fmt for j, fmt in enumerate(self.formats) if mask & (1 << j)]
+
+    def addeddate(self, i):
+        return (EPOCH + datetime.timedelta(seconds=self._columns["addeddate"][i])).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def row(self, i):
+        """Return row i as a dictionary, with the fields used by GDTape"""
+        return {
+            "identifier": self.identifier(i),
+            "date": self.date(i),
+            "avg_rating": self._columns["avg_rating"][i],
+            "num_reviews": self._columns["num_reviews"][i],
+            "downloads": self._columns["downloads"][i],
+            "addeddate": self.addeddate(i),
+            "format": self.format(i),
+            "collection": self.collection(i),
+        }
+
+    def row_numbers(self, collection_list=None):
+        """Return the row numbers of tapes in any of the collections in collection_list (all rows if None)"""
+        if collection_list is None:
+            return range(self.n_rows)
+        wanted = [j for j, c in enumerate(self.collections) if c in collection_list]
+        offsets = self._columns["post_offsets"]
+        post_rows = self._columns["post_rows"]
+        if len(wanted) == 1:
+            j = wanted[0]
+            return post_rows[offsets[j] : offsets[j + 1]].tolist()
+        return sorted(set(i for j in wanted for i in post_rows[offsets[j] : offsets[j + 1]]))
+
+    def rows(self, collection_list=None):
+        return [self.row(i) for i in self.row_numbers(collection_list)]
+
+
+class TapeJournal:
+    """An append-only log of new and changed tape rows for one ids directory.
+
+    Each line is {"period": <period>, "row": <tape row>}. A row replaces the row with the same identifier in
+    ids_<period>.json (or on an earlier line). Readers merge the journal into the period files as they load them,
+    and compact() folds it back into the period files once it grows past COMPACT_BYTES.
+    """
+
+    FILENAME = "journal.jsonl"
+    COMPACT_BYTES = 4 * 2**20
+
+    @classmethod
+    def path(cls, iddir):
+        return os.path.join(iddir, cls.FILENAME)
+
+    @classmethod
+    def size(cls, iddir):
+        path = cls.path(iddir)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    @classmethod
+    def append(cls, iddir, period, rows):
+        lines = [json.dumps({"period": str(period), "row": row}) + "\n" for row in rows]
+        with open(cls.path(iddir), "a") as f:
+            f.write("".join(lines))
+
+    @classmethod
+    def read(cls, iddir):
+        """Return {period: {identifier: row}}, keeping the latest row for each identifier"""
+        journal = {}
+        path = cls.path(iddir)
+        if not os.path.exists(path):
+            return journal
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    row = entry["row"]
+                    journal.setdefault(entry["period"], {})[row["identifier"]] = row
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Skipping bad line in {path}")  # eg. a partial line from an interrupted write
+        return journal
+
+    @classmethod
+    def clear(cls, iddir):
+        path = cls.path(iddir)
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def merge(rows, journal_rows):
+        """Return rows with journal_rows ({identifier: row}) replacing or added to them"""
+        if not journal_rows:
+            return rows
+        return list(TapeJournal.iter_merge(rows, journal_rows))
+
+    @staticmethod
+    def iter_merge(rows, journal_rows):
+        """Like merge, but rows may be a stream, and so is the result"""
+        seen = set()
+        for row in rows:
+            identifier = row["identifier"]
+            if identifier in journal_rows:
+                seen.add(identifier)
+                row = journal_rows[identifier]
+            yield row
+        for identifier, row in journal_rows.items():
+            if identifier not in seen:
+                yield row
+
+
+def load_workers(n=None):
+    """The number of processes to load archive chunks with. LOAD_WORKERS of 0 means one per core"""
+    n = config.optd.get("LOAD_WORKERS", 0) if n is None else n
+    return n if n > 0 else (os.cpu_count() or 1)
+
+
+def load_pool_context():
+    """A multiprocessing context which does not fork the (threaded) player. The pool's workers start from a clean process."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def scan_chunk(chunk_path, collection_list):
+    """Make sure the TapeIndex of a chunk is current, and select the rows in collection_list.
+
+    This runs in a worker process, so it returns a small picklable batch rather than the index:
+    (source_mtime_ns, source_size, max_addeddate, row numbers as bytes), or None if there is no index.
+    """
+    index = TapeIndex.load(chunk_path)
+    if index is None:
+        return None
+    try:
+        max_addeddate = index.max_addeddate() if len(index) > 0 else None
+        row_numbers = array.array("I", index.row_numbers(collection_list)).tobytes()
+        return (index.header["source_mtime_ns"], index.header["source_size"], max_addeddate, row_numbers)
+    finally:
+        index.close()
+
+
 class BaseTapeDownloader(abc.ABC):
     """Abstract base class for a tape downloader.
 
     Use one of the subclasses: IATapeDownloader or PhishinTapeDownloader.
     """
 
+    def __init__(self):
+        self._known_ids = {}  # period file path -> identifiers in the file and its journal
+
     def store_metadata(self, iddir, tapes, period_func=to_decade):
-        # Store the tapes json data into files by period
+        # Store the tapes json data into files by period.
+        # A new period is written whole. Rows for a period we already have are appended to the journal.
         n_tapes_added = 0
         os.makedirs(iddir, exist_ok=True)
         periods = sorted(list(set([period_func(t["date"]) for t in tapes])))
         logger.debug(f"storing metadata {periods}")
 
         for period in periods:
-            orig_tapes = []
             outpath = os.path.join(iddir, f"ids_{period}.json")
-            if os.path.exists(outpath):
-                orig_tapes = json.load(open(outpath, "r"))
             tapes_from_period = [t for t in tapes if period_func(t["date"]) == period]
-            new_ids = [x["identifier"] for x in tapes_from_period]
-            period_tapes = [x for x in orig_tapes if not x["identifier"] in new_ids] + tapes_from_period
-            n_period_tapes_added = len(period_tapes) - len(orig_tapes)
-            n_tapes_added = n_tapes_added + n_period_tapes_added
-            if n_period_tapes_added > 0:  # NOTE This condition prevents updates for _everything_ unless there are new tapes.
+            if not os.path.exists(outpath):
+                period_tapes = list({t["identifier"]: t for t in tapes_from_period}.values())
                 logger.info(f"Writing {len(period_tapes)} tapes to {outpath}")
+                self._known_ids.pop(outpath, None)
+                if self.write_period(outpath, period_tapes):
+                    self._known_ids[outpath] = {t["identifier"] for t in period_tapes}
+                    n_tapes_added = n_tapes_added + len(period_tapes)
+                continue
+            known_ids = self.known_ids(iddir, period, outpath)
+            new_ids = {t["identifier"] for t in tapes_from_period} - known_ids
+            if len(new_ids) > 0:  # NOTE This condition prevents updates for _everything_ unless there are new tapes.
+                logger.info(f"Adding {len(tapes_from_period)} tapes for {period} to {TapeJournal.path(iddir)}")
                 try:
-                    tmpfile = tempfile.mkstemp(".json")[1]
-                    json.dump(period_tapes, open(tmpfile, "w"), indent=2)
-                    os.rename(tmpfile, outpath)
-                    logger.debug(f"renamed {tmpfile} to {outpath}")
-                except Exception:
-                    logger.debug(f"removing {tmpfile}")
-                    os.remove(tmpfile)
+                    TapeJournal.append(iddir, period, tapes_from_period)
+                except Exception as e:
+                    logger.warning(f"Failed to append to journal in {iddir}: {e}")
+                    continue
+                known_ids.update(new_ids)
+                n_tapes_added = n_tapes_added + len(new_ids)
         if n_tapes_added > 0:
             logger.info(f"added {n_tapes_added} tapes by period")
+        if TapeJournal.size(iddir) > TapeJournal.COMPACT_BYTES:
+            self.compact_journal(iddir)
         return n_tapes_added
 
+    def write_period(self, outpath, period_tapes):
+        """Rewrite a whole period file. Returns True on success"""
+        try:
+            tmpfile = tempfile.mkstemp(".json")[1]
+            json.dump(period_tapes, open(tmpfile, "w"), indent=2)
+            os.rename(tmpfile, outpath)
+            logger.debug(f"renamed {tmpfile} to {outpath}")
+        except Exception:
+            logger.debug(f"removing {tmpfile}")
+            os.remove(tmpfile)
+            return False
+        self.update_period_index(outpath, period_tapes)
+        return True
+
+    def known_ids(self, iddir, period, outpath):
+        """The identifiers already stored for a period, in its file or the journal"""
+        ids = self._known_ids.get(outpath)
+        if ids is None:
+            ids = self.period_ids(outpath)
+            ids.update(TapeJournal.read(iddir).get(str(period), {}).keys())
+            self._known_ids[outpath] = ids
+        return ids
+
+    def period_ids(self, outpath):
+        return {t["identifier"] for t in json.load(open(outpath, "r"))}
+
+    def compact_journal(self, iddir):
+        """Fold the journal back into the period files of iddir"""
+        journal = TapeJournal.read(iddir)
+        for period, journal_rows in journal.items():
+            outpath = os.path.join(iddir, f"ids_{period}.json")
+            orig_tapes = json.load(open(outpath, "r")) if os.path.exists(outpath) else []
+            period_tapes = TapeJournal.merge(orig_tapes, journal_rows)
+            logger.info(f"Compacting {len(journal_rows)} journal rows into {outpath}")
+            if not self.write_period(outpath, period_tapes):
+                logger.warning(f"Failed to compact journal into {outpath}. Keeping the journal")
+                return False
+        TapeJournal.clear(iddir)
+        return True
+
+    def update_period_index(self, outpath, period_tapes):
+        """Called after a period file is rewritten. Subclasses may keep a derived index of the file in sync."""
+        pass
+
     @abc.abstractmethod
     def get_all_tapes(self, iddir, min_addeddate=None, date_range=None):
         """Get a list of all tapes."""
@@ -150,6 +632,12 @@ def remove_none(lis):
     return [a for a in lis if a is not None]
 
 
+def collection_artist(collection, collection_list):
+    """The artist of a tape in collection: the first of collection_list that it belongs to"""
+    colls = collection_list
+    return colls[min([colls.index(c) if c in colls else 100 for c in collection])] if len(colls) > 1 else colls[0]
+
+
 def parse_plex_collection_name(collection_name):
     if not isinstance(collection_name, str) or not collection_name.startswith("Plex_"):
         return (None, None)
@@ -175,12 +663,15 @@ class Archivary:
         collection_list=["GratefulDead"],
         date_range=None,
         local_home=os.path.join(os.getenv("HOME"), "archive"),
+        paged=False,
     ):
         # if 'rElOaD' in collection_list:
         #     self.reload_ids = True
         #     collection_list.remove('rElOaD')
         self.collection_list = collection_list
         self.archives = []
+        self._tape_collections = {}
+        self._dates_lock = Lock()
         phishin_archive = None
         ia_archive = None
         local_archive = None
@@ -211,6 +702,7 @@ class Archivary:
                 with_latest=with_latest,
                 collection_list=ia_collections,
                 date_range=date_range,
+                paged=paged,
             )
         if len(plex_collections) > 0:
             plex_servers = config.normalize_plex_servers(config.optd.get("PLEX_SERVERS", []))
@@ -254,11 +746,66 @@ class Archivary:
         else:
             self.tape_dates = self.get_tape_dates()
             self.dates = sorted(self.tape_dates.keys())
+        self.build_calendar()
+
+    def build_calendar(self):
+        """Index the dates for the knobs. Called whenever the dates change."""
+        years = set().union(*(a.year_list() for a in self.archives))
+        self.calendar = CalendarIndex(self.dates, self.tape_dates, years)
+        self.timeline = TimelineIndex(self.dates, self.collection_list)
 
     def year_list(self):
-        t = [a.year_list() for a in self.archives]
-        yl = sorted(set([item for sublist in t for item in sublist]))
-        return yl
+        return self.calendar.years
+
+    def artists_on(self, date):
+        """The artists with tapes on date (a string)"""
+        return self.calendar.artists(date)
+
+    def song_dates(self, title):
+        """The dates with tapes on which title was played"""
+        return [d for d in SONGS.dates(title) if d in self.tape_dates]
+
+    def venue_search(self, query):
+        """{place: dates with tapes} of the places matching query, by prefix of each word"""
+        places = {k: [d for d in v if d in self.tape_dates] for k, v in VENUES.search(query).items()}
+        return {k: v for k, v in places.items() if len(v) > 0}
+
+    def today_in_history(self, today=None):
+        """The dates (datetime.date) with tapes on this day (default: today) in other years"""
+        today = today if today else datetime.date.today()
+        return [datetime.date(y, today.month, today.day) for y in self.calendar.years_on(today.month, today.day)]
+
+    def next_artist_date(self, artist, date):
+        """The next date (a string) after date with a tape by artist in any archive, wrapping around"""
+        dates = remove_none([a.next_artist_date(artist, date) for a in self.archives])
+        if len(dates) == 0:
+            return None
+        return min(dates, key=lambda d: (d <= date, d))
+
+    def ensure_year(self, year):
+        """In any paged archive, build the tapes of the years around year in the background. The dates do not change."""
+        for a in self.archives:
+            a.ensure_year(year)
+
+    def start_migration(self):
+        """Start moving the metadata files of older versions into the metadata store of each archive, in the background"""
+        for dbpath in sorted({a.dbpath for a in self.archives}):
+            metadata_store(dbpath).start_migration()
+
+    def memory_stats(self):
+        """The resident-bytes counters of each archive which keeps them"""
+        return {a.archive_type: a.memory_stats() for a in self.archives if hasattr(a, "memory_stats")}
+
+    def refresh_dates(self):
+        """Index the dates of the archives again, after they have changed"""
+        with self._dates_lock:
+            for a in self.archives:
+                a.artist_index.clear()  # the tapes of a date may have been removed or changed in place
+            tape_dates = self.get_tape_dates()
+            dates = sorted(tape_dates.keys())
+            self.tape_dates = tape_dates
+            self.dates = dates
+            self.build_calendar()
 
     def best_tape(self, date, resort=True):
         if date not in self.dates:
@@ -271,28 +818,39 @@ class Archivary:
         return bt[0]
 
     def tape_at_time(self, then_time, default_start):
-        tat = remove_none([a.tape_at_time(then_time, default_start) for a in self.archives])
-        if len(tat) == 0:
-            return None
-        return tat[0]
+        date = self.timeline.date_at(then_time, default_start)
+        return None if date is None else self.best_tape(date)
+
+    def tape_years_ago(self, years, default_start, now=None):
+        """The tape which was playing years ago at this moment (default: now)"""
+        now = now if now else datetime.datetime.now()
+        try:
+            then_time = now.replace(year=now.year - years)
+        except ValueError:  # Feb 29th
+            then_time = now.replace(year=now.year - years, day=28)
+        return self.tape_at_time(then_time, default_start)
 
     def tape_at_date(self, dt, which_tape=0):
         pass
 
     def tape_start_time(self, dt, default_start=datetime.time(19, 0)):
-        tst = remove_none([a.tape_start_time(dt, default_start) for a in self.archives])
-        if len(tst) == 0:
-            return None
-        return tst[0]
+        return self.timeline.start(dt.strftime("%Y-%m-%d"), default_start)
+
+    def tape_collections(self, tape):
+        """The collections of collection_list which tape belongs to. Computed once per identifier."""
+        collections = self._tape_collections.get(tape.identifier)
+        if collections is None:
+            collections = tuple(c for c in self.collection_list if c.replace("Local_", "") in tape.collection)
+            self._tape_collections[tape.identifier] = collections
+        return collections
 
     def sort_across_collection(self, tapes):
         cdict = {}
         for c in self.collection_list:
             cdict[c] = []
         for t in tapes:
-            for c in self.collection_list:
-                if c.replace("Local_", "") in t.collection:
-                    cdict[c].append(t)
+            for c in self.tape_collections(t):
+                cdict[c].append(t)
 
         result = []
         max_n_collection = max([len(cdict[k]) for k in cdict])
@@ -304,18 +862,13 @@ class Archivary:
 
     def get_tape_dates(self, sort_across=True):  # Archivary
         _ = [a.get_tape_dates() for a in self.archives]
-        td = self.archives[0].tape_dates
-        for a in self.archives[1:]:
-            logger.info(f"getting tapes from {a}")
-            for date, tapes in a.tape_dates.items():
-                if date in td.keys():
-                    for t in tapes:
-                        td[date].append(t)
-                else:
-                    td[date] = tapes
-        if (not sort_across) or (len(self.archives) == 1):
-            return td
-        td = {date: self.sort_across_collection(tapes) for date, tapes in td.items()}
+        if len(self.archives) == 1:
+            return self.archives[0].tape_dates
+        order = self.sort_across_collection if sort_across else None
+        td = getattr(self, "tape_dates", None)
+        if not isinstance(td, MergedDateIndex) or td.order != order:
+            td = MergedDateIndex(self.archives, order=order)
+        td.refresh()
         return td
 
     def resort_tape_date(self, date):
@@ -324,8 +877,9 @@ class Archivary:
             return None
         bt = [remove_none(a.resort_tape_date(date)) for a in self.archives]
         bt = flatten(bt)
-        bt = list(dict.fromkeys(bt))
+        bt = TAPES.fold(bt)
         bt = self.sort_across_collection(bt)
+        self.calendar.forget(date)  # tapes found to be bad have just been removed
         return bt
 
     def load_archive(self, reload_ids, with_latest):
@@ -337,6 +891,7 @@ class Archivary:
         # reload the tape dates, so that the Time Machine knows about the new stuff.
         self.tape_dates = self.get_tape_dates()
         self.dates = sorted(self.tape_dates.keys())
+        self.build_calendar()
 
     def year_artists(self, start_year, end_year=None):
         for a in self.archives:
@@ -396,6 +951,7 @@ class BaseArchive(abc.ABC):
             else:
                 self.downloader = IATapeDownloader(url)
         self.set_data = None
+        self.artist_index = ArtistIndex(attrgetter("artist"))
 
     def __str__(self):
         return self.__repr__()
@@ -439,34 +995,42 @@ class BaseArchive(abc.ABC):
         tape = self.tape_at_date(dt)
         if not tape:
             return None
-        tape_start_time = tape.set_data["start_time"] if tape.set_data else None
+        tape_start_time = getattr(tape.set_data, "start_time", None)
         if tape_start_time is None:
             tape_start_time = default_start
         tape_start = datetime.datetime.combine(dt.date(), tape_start_time)  # date + time
         return tape_start
 
-    def get_tape_dates(self, sort_within=True):  # BaseArchive
+    @staticmethod
+    def group_by_date(tapes):
         tape_dates = {}
-        for tape in self.tapes:
+        for tape in tapes:
             k = tape.date
             if k not in tape_dates.keys():
                 tape_dates[k] = [tape]
             else:
                 tape_dates[k].append(tape)
-        # Now that we have all tape for a date, put them in the right order
-        if not sort_within:
-            self.tape_dates = tape_dates
-        else:
-            self.tape_dates = {}
-            for k, v in tape_dates.items():
-                try:
-                    self.tape_dates[k] = sorted(v, key=methodcaller("compute_score"), reverse=True)
-                except Exception as e:
-                    self.tape_dates[k] = v
-                    logger.exception(f"{e}")
-                    logger.warning(f"Failed to sort tapes on {k}")
+        return tape_dates
+
+    def ensure_year(self, year):
+        pass
+
+    def get_tape_dates(self, sort_within=True):  # BaseArchive
+        tapes = self.tapes.refs() if isinstance(self.tapes, LazyTapeList) else self.tapes
+        tape_dates = self.group_by_date(tapes)
+        # Now that we have all tape for a date, put them in the right order. This happens when the date is first used.
+        order = self.order_tapes if sort_within else None
+        self.artist_index.update(tape_dates)
+        self.tape_dates = {k: LazyTapeList(v, order=order) for k, v in tape_dates.items()}
         return self.tape_dates
 
+    def next_artist_date(self, artist, date):
+        """The next date (a string) after date with a tape by artist, wrapping around. None if there is none."""
+        return self.artist_index.next_date(artist, date)
+
+    def order_tapes(self, tapes):
+        return sorted(tapes, key=methodcaller("compute_score"), reverse=True)
+
     def get_all_collection_names(self):
         return self.downloader.get_all_collection_names()
 
@@ -491,18 +1055,103 @@ class BaseArchive(abc.ABC):
         return tapes
 
 
+# Format preferences, shared by every tape and track.
+# NOTE This should be part of the player, not part of the tape or track, as it is now
+LOSSY_FORMATS = ("Ogg Vorbis", "VBR MP3", "MP3")
+LOSSLESS_FORMATS = ("Flac", "Shorten") + LOSSY_FORMATS
+ANY_PLAYABLE_FORMATS = frozenset(LOSSY_FORMATS + LOSSLESS_FORMATS)  # with either PLAY_LOSSLESS setting
+FORMAT_RANK = {
+    LOSSY_FORMATS: {f: i for i, f in enumerate(LOSSY_FORMATS)},
+    LOSSLESS_FORMATS: {f: i for i, f in enumerate(LOSSLESS_FORMATS)},
+}
+
+
+def playable_formats():
+    return LOSSLESS_FORMATS if config.optd.get("PLAY_LOSSLESS") else LOSSY_FORMATS
+
+
+TITLE_DATE_PREFIX = re.compile(r"^[a-zA-Z]{2,5}_*\d{2}(?:\d{2})?[-.]\d{2}[-.]\d{2}[ ]*([td]\d*)*")  # eg. gd77-05-08d1t01
+TITLE_EXTENSION = re.compile(r"(.flac)|(.mp3)|(.ogg)$")
+
+
+def clean_title(title):
+    """Strip the date prefix and the file extension which some tapers leave in the titles of tracks"""
+    return TITLE_EXTENSION.sub("", TITLE_DATE_PREFIX.sub("", title).strip()).strip()
+
+
+class NameTable:
+    """Interns names which are shared by many tapes (collections, formats) as small integer ids
+
+    If names is given, the table is closed: any other name gets the id of other. This keeps the ids of a table
+    used for bitmasks (see mask) small, whatever names turn up in the data.
+    """
+
+    def __init__(self, names=None, other="Other"):
+        self.names = []
+        self._ids = {}
+        self._tuples = {}
+        self.closed = False
+        for name in list(names or []) + ([other] if names else []):
+            self.id(name)
+        self.closed = names is not None
+        self._other = self._ids.get(other)
+
+    def id(self, name):
+        i = self._ids.get(name)
+        if i is None:
+            if self.closed:
+                return self._other
+            i = self._ids[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return i
+
+    def ids(self, names):
+        """return a tuple of ids for names. Equal lists of names share the same tuple"""
+        key = tuple(names)
+        ids = self._tuples.get(key)
+        if ids is None:
+            ids = self._tuples[key] = tuple(self.id(n) for n in key)
+        return ids
+
+    def mask(self, names):
+        mask = 0
+        for name in names:
+            mask |= 1 << self.id(name)
+        return mask
+
+    def from_ids(self, ids):
+        return [self.names[i] for i in ids]
+
+    def from_mask(self, mask):
+        return [name for i, name in enumerate(self.names) if (mask >> i) & 1]
+
+
+# The formats which get their own bit in the format mask of a tape. Any other format sets the "Other" bit.
+MASK_FORMATS = LOSSLESS_FORMATS + ("24bit Flac", "Apple Lossless Audio", "WAVE", "AIFF", "128Kbps MP3", "64Kbps MP3")
+
+COLLECTION_NAMES = NameTable()
+FORMAT_NAMES = NameTable(MASK_FORMATS)
+STREAM_ONLY_ID = COLLECTION_NAMES.id("stream_only")
+
+# Approximate bytes held by a built GDTape and by each of its tracks, from bench/bench_memory.py
+RESIDENT_TAPE_BYTES = 830
+RESIDENT_TRACK_BYTES = 650
+
+
 class BaseTape(abc.ABC):
+    __slots__ = (
+        "dbpath",
+        "_breaks_added",
+        "meta_loaded",
+        "artist",
+        "meta_path",
+        "_tracks",
+        "_remove_from_archive",
+        "__weakref__",
+    )
+
     def __init__(self, dbpath, raw_json, set_data=None):
         self.dbpath = dbpath
-
-        """ NOTE This should be part of the player, not part of the tape or track, as it is now """
-        if config.optd["PLAY_LOSSLESS"]:
-            self._playable_formats = ["Flac", "Shorten", "Ogg Vorbis", "VBR MP3", "MP3"]
-        else:
-            self._playable_formats = ["Ogg Vorbis", "VBR MP3", "MP3"]
-        self._lossy_formats = ["Ogg Vorbis", "VBR MP3", "MP3"]
-        """ ----------------------------------------------------------------------------------- """
-
         self._breaks_added = False
         self.meta_loaded = False
         self.format = None
@@ -512,6 +1161,14 @@ class BaseTape(abc.ABC):
         self._tracks = []
         self._remove_from_archive = False
 
+    @property
+    def _playable_formats(self):
+        return playable_formats()
+
+    @property
+    def _lossy_formats(self):
+        return LOSSY_FORMATS
+
     def __str__(self):
         return self.__repr__()
 
@@ -554,6 +1211,8 @@ class BaseTape(abc.ABC):
 class BaseTrack:
     """A Base track from a tape"""
 
+    __slots__ = ("parent_id", "__weakref__")
+
     def __init__(self, tdict, parent_id, break_track=False):
         self.parent_id = parent_id
 
@@ -569,10 +1228,1242 @@ class BaseTrack:
         pass
 
 
+class TapeRef:
+    """A lightweight reference to a tape's row in a TapeIndex (or a raw json row, if source is None).
+
+    The archive turns it into a real tape the first time it is touched.
+    """
+
+    __slots__ = ("archive", "source", "row")
+
+    def __init__(self, archive, source, row):
+        self.archive = archive
+        self.source = source
+        self.row = row
+
+    def __repr__(self):
+        return f"TapeRef {self.identifier} {self.date}"
+
+    def raw(self):
+        return self.row if self.source is None else self.source.row(self.row)
+
+    @property
+    def identifier(self):
+        return self.row["identifier"] if self.source is None else self.source.identifier(self.row)
+
+    @property
+    def date(self):
+        if self.source is not None:
+            return self.source.date(self.row)
+        date = self.row["date"]
+        date = date[0] if isinstance(date, list) else date
+        return date[:10]
+
+    @property
+    def collection(self):
+        return self.row["collection"] if self.source is None else self.source.collection(self.row)
+
+    def tape(self):
+        return self.archive.make_tape(self)
+
+
+class TapeRegistry:
+    """The tapes of the process, one per identifier and scope, shared by all the archives of the same scope.
+
+    The scope is what the archive-specific fields of a tape (artist, set_data, collection) depend on, eg. the dbpath
+    and collection_list of a GDArchive, so archives of different collections do not share tapes.
+    A tape (or TapeRef) which shows up in more than one collection is folded into the first one.
+    The registry holds weak references, so it does not keep tapes alive by itself.
+    """
+
+    def __init__(self):
+        self._tapes = weakref.WeakValueDictionary()
+        self._lock = Lock()
+        self.folded_ids = set()
+
+    def __len__(self):
+        return len(self._tapes)
+
+    @property
+    def folded(self):
+        """The number of identifiers which have been found more than once"""
+        return len(self.folded_ids)
+
+    def get(self, identifier, scope=()):
+        return self._tapes.get((scope, identifier))
+
+    def add(self, tape, scope=()):
+        """Register tape in scope, returning the tape already registered for its identifier there, if there is one"""
+        with self._lock:
+            existing = self._tapes.get((scope, tape.identifier))
+            if existing is None:
+                self._tapes[(scope, tape.identifier)] = tape
+                return tape
+        if existing is not tape:
+            self.folded_ids.add(tape.identifier)
+        return existing
+
+    def fold(self, items, seen=None):
+        """Drop the tapes (or TapeRefs) whose identifier is in seen or earlier in items. Updates seen."""
+        seen = set() if seen is None else seen
+        unique = []
+        for item in items:
+            identifier = item.identifier
+            if identifier in seen:
+                self.folded_ids.add(identifier)
+                continue
+            seen.add(identifier)
+            unique.append(item)
+        return unique
+
+
+TAPES = TapeRegistry()
+
+
+class TaperMatcher:
+    """Multi-pattern matcher, to find which of the favored tapers appear in an identifier in one pass over it.
+
+    The regular expression looks ahead for the longest pattern starting at each position of the text, so
+    overlapping patterns are all found. Any shorter pattern inside a longer one which matched is then added.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = sorted(set(p.lower() for p in patterns if len(p) > 0), key=len, reverse=True)
+        self._regex = re.compile("(?=(" + "|".join(map(re.escape, self.patterns)) + "))") if self.patterns else None
+        self._contains = {p: {q for q in self.patterns if q in p} for p in self.patterns}
+
+    def match(self, text):
+        """The set of patterns found in text (which should be lowercase)"""
+        if self._regex is None:
+            return set()
+        found = set()
+        for p in set(self._regex.findall(text)):
+            found.update(self._contains[p])
+        return found
+
+
+class TitleMatcher:
+    """Finds the titles close to a query, as difflib.get_close_matches does, using an index of the q-grams (runs of q
+    letters, ignoring case and spaces) of the titles.
+
+    Only the titles which share a q-gram with the query are compared with it, by SequenceMatcher.ratio, so the scores
+    and cutoff are those of get_close_matches. A title with no q-gram in common with the query is never matched, even
+    if scattered single letters would give it a ratio above the cutoff.
+    """
+
+    def __init__(self, titles, q=3):
+        self.q = q
+        self.titles = []
+        self._postings = {}  # q-gram -> title numbers
+        seen = set()
+        for title in titles:
+            if not isinstance(title, str) or title in seen:
+                continue
+            seen.add(title)
+            for gram in self.grams(title):
+                self._postings.setdefault(gram, []).append(len(self.titles))
+            self.titles.append(title)
+
+    def grams(self, text):
+        padded = " " * (self.q - 1) + " ".join(text.lower().split()) + " "
+        return {padded[i : i + self.q] for i in range(len(padded) - self.q + 1)}
+
+    def candidates(self, query):
+        """The numbers of the titles which share a q-gram with query"""
+        found = set()
+        for gram in self.grams(query):
+            found.update(self._postings.get(gram, ()))
+        return sorted(found)
+
+    def scores(self, query, cutoff=0.0):
+        """title number -> SequenceMatcher ratio to query, for the candidate titles whose ratio is at least cutoff"""
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(query)
+        scores = {}
+        for i in self.candidates(query):
+            matcher.set_seq1(self.titles[i])
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                ratio = matcher.ratio()
+                if ratio >= cutoff:
+                    scores[i] = ratio
+        return scores
+
+    def close_matches(self, query, n=3, cutoff=0.6):
+        """The (at most n) titles whose similarity to query is at least cutoff, best first"""
+        if not n > 0:
+            raise ValueError(f"n must be > 0: {n}")
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError(f"cutoff must be in [0.0, 1.0]: {cutoff}")
+        scored = [(score, self.titles[i]) for i, score in self.scores(query, cutoff).items()]
+        return [title for score, title in heapq.nlargest(n, scored)]
+
+
+class ScoreEngine:
+    """The scores used to sort the tapes of a date. High score means it should be played first.
+
+    The part of a score which comes from fields that never change is computed once, when the tape is added.
+    Each identifier is tagged with the points of the favored tapers it contains when it is added, and tagged again
+    only when FAVORED_TAPER changes. When the options change, every tape is scored again in one batch.
+    The part which comes from the metadata (track titles) is recorded when the metadata is loaded. It is kept
+    in a file next to the metadata, so sorting never has to look for metadata on disk. A score is appended to the
+    file only when it changes, and the file is compacted on load when it holds superseded lines.
+    """
+
+    FILENAME = "scores.jsonl"
+
+    def __init__(self):
+        self._slots = {}  # identifier -> position in the arrays
+        self._lower_ids = []
+        self._static = array.array("d")
+        self._taper_points = array.array("d")
+        self._meta = array.array("d")  # NaN if the metadata has not been seen
+        self._format_masks = []  # masks of FORMAT_NAMES, which may be wider than 64 bits
+        self._scores = array.array("d")  # NaN if the score needs to be computed again
+        self._known_meta = {}  # metadata scores read from file, for tapes which have not been added yet
+        self._loaded_paths = set()
+        self._options = None
+        self._fav_option = None
+        self._fav_taper = {}
+        self._matcher = TaperMatcher([])
+        self._playable_mask = 0
+
+    def __len__(self):
+        return len(self._lower_ids)
+
+    def load(self, dbpath):
+        """Read the metadata scores recorded in dbpath (once per dbpath)"""
+        path = os.path.join(dbpath, self.FILENAME)
+        if path in self._loaded_paths:
+            return
+        self._loaded_paths.add(path)
+        if not os.path.exists(path):
+            return
+        rows = {}
+        n_lines = 0
+        with open(path, "r") as f:
+            for line in f:
+                n_lines = n_lines + 1
+                try:
+                    row = json.loads(line)
+                    rows[row["identifier"]] = float(row["meta"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+        for identifier, meta in rows.items():
+            self.set_meta(identifier, meta)
+        if n_lines > len(rows):
+            self.compact(path, rows)
+
+    def compact(self, path, rows):
+        """Rewrite the scores file at path with one line per identifier"""
+        logger.info(f"Compacting {path} to {len(rows)} scores")
+        tmpfile = tempfile.mkstemp(".jsonl", dir=os.path.dirname(path))[1]
+        try:
+            with open(tmpfile, "w") as f:
+                f.write("".join(json.dumps({"identifier": k, "meta": v}) + "\n" for k, v in rows.items()))
+            os.replace(tmpfile, path)
+        except OSError as e:
+            logger.warning(f"Failed to compact {path}: {e}")
+            os.remove(tmpfile)
+
+    @staticmethod
+    def static_score(tape):
+        score = 3 + (10 if tape.stream_only() else 0)
+        score = score + tape.download_rate
+        score = score + math.log(1 + tape.downloads)
+        # down-weigh avg_rating: it's usually about the show, not the tape.
+        return score + 0.5 * (tape.avg_rating - 2.0 / math.sqrt(tape.num_reviews))
+
+    def slot(self, tape):
+        slot = self._slots.get(tape.identifier)
+        if slot is None:
+            slot = len(self._lower_ids)
+            self._slots[tape.identifier] = slot
+            self._lower_ids.append(tape.identifier.lower())
+            self._static.append(self.static_score(tape))
+            self._taper_points.append(self.taper_points(self._lower_ids[slot]))
+            self._meta.append(self._known_meta.pop(tape.identifier, math.nan))
+            self._format_masks.append(tape._format_mask)
+            self._scores.append(math.nan)
+        return slot
+
+    def check_options(self):
+        optd = getattr(config, "optd", {})
+        options = (optd.get("FAVORED_TAPER", []), optd.get("PLAY_LOSSLESS"))
+        if options != self._options:
+            self._options = options
+            self.rescore()
+
+    def rescore(self):
+        """Compute every score again, eg. because the options have changed"""
+        fav_taper = getattr(config, "optd", {}).get("FAVORED_TAPER", [])
+        if fav_taper != self._fav_option:
+            self.set_tapers(fav_taper)
+        self._playable_mask = FORMAT_NAMES.mask(playable_formats())
+        for slot in range(len(self._scores)):
+            self._scores[slot] = self._compute(slot)
+
+    def set_tapers(self, fav_taper):
+        """Tag every identifier with the points of the favored tapers it contains"""
+        self._fav_option = fav_taper
+        if isinstance(fav_taper, str):
+            fav_taper = [fav_taper]
+        if isinstance(fav_taper, (list, tuple)):
+            fav_taper = {x: 1 for x in fav_taper}
+        self._fav_taper = {}
+        for taper, points in fav_taper.items():
+            self._fav_taper[taper.lower()] = self._fav_taper.get(taper.lower(), 0) + float(points)
+        self._matcher = TaperMatcher(self._fav_taper.keys())
+        for slot, lower_id in enumerate(self._lower_ids):
+            self._taper_points[slot] = self.taper_points(lower_id)
+
+    def taper_points(self, lower_id):
+        return sum(self._fav_taper[taper] for taper in self._matcher.match(lower_id))
+
+    def _compute(self, slot):
+        meta = self._meta[slot]
+        if not math.isnan(meta) and (self._format_masks[slot] & self._playable_mask) == 0:
+            return -1
+        score = self._static[slot] + self._taper_points[slot]
+        if not math.isnan(meta):
+            score = score + meta
+        return score
+
+    def score(self, tape):
+        self.check_options()
+        slot = self.slot(tape)
+        score = self._scores[slot]
+        if math.isnan(score):
+            score = self._compute(slot)
+            self._scores[slot] = score
+        return score
+
+    def invalidate(self, identifier):
+        slot = self._slots.get(identifier)
+        if slot is not None:
+            self._scores[slot] = math.nan
+
+    def get_meta(self, identifier):
+        """The metadata score of identifier, or NaN if it is not known"""
+        slot = self._slots.get(identifier)
+        return self._known_meta.get(identifier, math.nan) if slot is None else self._meta[slot]
+
+    def set_meta(self, identifier, meta):
+        slot = self._slots.get(identifier)
+        if slot is None:
+            self._known_meta[identifier] = meta
+            return
+        self._meta[slot] = meta
+        self.invalidate(identifier)
+
+    def record_meta(self, tape):
+        """Record the metadata score of a tape whose metadata has just been loaded"""
+        meta = 3 * (tape.title_fraction() - 1) + min(20, len(tape._tracks)) / 4  # reduce score for tapes without titles.
+        if meta == self.get_meta(tape.identifier):
+            return
+        self.set_meta(tape.identifier, meta)
+        try:
+            with open(os.path.join(tape.dbpath, self.FILENAME), "a") as f:
+                f.write(json.dumps({"identifier": tape.identifier, "meta": meta}) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to record the score of {tape.identifier}: {e}")
+
+
+SCORES = ScoreEngine()
+
+
+class SongIndex:
+    """Which dates (and tapes) have each song, keyed by the normalized title.
+
+    The songs come from the set lists of GDSetBreaks, and from the track titles of each tape when its metadata is loaded.
+    The track titles are kept in a file next to the metadata, so they are indexed again without reading the metadata.
+    Everything is indexed on the first query.
+    """
+
+    FILENAME = "songs.jsonl"
+    SKIP_TITLES = {"", "unknown", "set break", "encore break", "location break", "record flip", "record change", "tuning"}
+
+    def __init__(self):
+        self._songs = {}  # normalized title -> [(date, source, position)]
+        self._titles = {}  # normalized title -> the title as first seen
+        self._indexed = set()  # identifiers of the indexed tapes
+        self._has_set_rows = False
+        self._pending_rows = []
+        self._pending_paths = []
+        self._loaded_paths = set()
+        self._lock = Lock()
+
+    def __len__(self):
+        self.index_pending()
+        return len(self._songs)
+
+    @staticmethod
+    def normalize(title):
+        return " ".join(re.sub(r"[^a-z0-9 ]+", " ", title.lower().replace("&", " and ")).split())
+
+    @staticmethod
+    def split_segues(title):
+        return [x for x in re.split(r"\s*-*>\s*", title) if x.strip()]
+
+    def load(self, dbpath):
+        """Index the track titles recorded in dbpath (once per dbpath)"""
+        path = os.path.join(dbpath, self.FILENAME)
+        if path not in self._loaded_paths:
+            self._loaded_paths.add(path)
+            self._pending_paths.append(path)
+
+    def add_set_rows(self, set_rows):
+        """Index the set lists (once; every GDSetBreaks reads the same set lists)"""
+        if self._has_set_rows:
+            return
+        self._has_set_rows = True
+        self._pending_rows.append(set_rows)
+
+    def index_pending(self):
+        with self._lock:
+            while self._pending_rows:
+                for row in self._pending_rows.pop():
+                    self.add(row.song, row.date, row.artist, row.show_set)
+            while self._pending_paths:
+                path = self._pending_paths.pop()
+                if not os.path.exists(path):
+                    continue
+                with open(path, "r") as f:
+                    for line in f:
+                        try:
+                            row = json.loads(line)
+                            self.add_tape(row["identifier"], row["date"], row["titles"])
+                        except (ValueError, KeyError, TypeError):
+                            continue
+
+    def add(self, title, date, source, position):
+        for song in self.split_segues(title):
+            key = self.normalize(song)
+            if key in self.SKIP_TITLES:
+                continue
+            self._titles.setdefault(key, song.strip())
+            self._songs.setdefault(key, []).append((date, source, position))
+
+    def add_tape(self, identifier, date, titles):
+        if identifier in self._indexed:
+            return False
+        self._indexed.add(identifier)
+        for position, title in enumerate(titles):
+            self.add(title, date, identifier, position)
+        return True
+
+    def record_tape(self, tape):
+        """Index (and record) the track titles of a tape whose metadata has just been loaded"""
+        self.index_pending()
+        titles = [t.title for t in tape._tracks if isinstance(t.title, str)]
+        if not self.add_tape(tape.identifier, tape.date, titles):
+            return
+        try:
+            with open(os.path.join(tape.dbpath, self.FILENAME), "a") as f:
+                f.write(json.dumps({"identifier": tape.identifier, "date": tape.date, "titles": titles}) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to record the songs of {tape.identifier}: {e}")
+
+    def occurrences(self, title):
+        """The (date, source, position) of each time title was played, by date. The source is an artist
+        (for a set list, with the set as position) or a tape identifier (with the track number as position)"""
+        self.index_pending()
+        return sorted(self._songs.get(self.normalize(title), []), key=lambda x: (x[0], str(x[1]), str(x[2])))
+
+    def dates(self, title):
+        return sorted({x[0] for x in self.occurrences(title)})
+
+    def titles(self):
+        self.index_pending()
+        return sorted(self._titles.values())
+
+
+SONGS = SongIndex()
+
+
+class VenueIndex:
+    """Which dates were played at each place ("venue, city, state"), with the words of the places indexed for search.
+
+    The places come from the set lists of GDSetBreaks, from any vcs files ({date: "venue, city, state"}) in dbpath/vcs,
+    and from the venue and coverage of each tape when its metadata is loaded. These are kept in a file next to the
+    metadata, like the songs. A query matches the places which have a word starting with each word of the query.
+    Everything is indexed on the first query.
+    """
+
+    FILENAME = "venues.jsonl"
+
+    def __init__(self):
+        self._places = {}  # place -> set of dates
+        self._words = {}  # word -> set of places
+        self._sorted_words = []
+        self._indexed = set()  # identifiers of the indexed tapes
+        self._has_set_rows = False
+        self._pending_rows = []
+        self._pending_paths = []
+        self._loaded_paths = set()
+        self._lock = Lock()
+
+    def __len__(self):
+        self.index_pending()
+        return len(self._places)
+
+    @staticmethod
+    def words(text):
+        return re.findall(r"[a-z0-9]+", text.lower())
+
+    def load(self, dbpath):
+        """Index the places recorded in dbpath, and its vcs files (once per dbpath)"""
+        if dbpath in self._loaded_paths:
+            return
+        self._loaded_paths.add(dbpath)
+        vcs_dir = os.path.join(dbpath, "vcs")
+        vcs_paths = sorted(os.path.join(vcs_dir, x) for x in os.listdir(vcs_dir)) if os.path.isdir(vcs_dir) else []
+        self._pending_paths.extend([os.path.join(dbpath, self.FILENAME)] + [x for x in vcs_paths if x.endswith("_vcs.json")])
+
+    def add_set_rows(self, set_rows):
+        """Index the set lists (once; every GDSetBreaks reads the same set lists)"""
+        if self._has_set_rows:
+            return
+        self._has_set_rows = True
+        self._pending_rows.append(set_rows)
+
+    def index_pending(self):
+        with self._lock:
+            while self._pending_rows:
+                for row in self._pending_rows.pop():
+                    self.add(row.date, row.venue, row.city, row.state)
+            while self._pending_paths:
+                path = self._pending_paths.pop()
+                if not os.path.exists(path):
+                    continue
+                if path.endswith(".json"):
+                    for date, vcs in json.load(open(path, "r")).items():
+                        self.add(date, vcs)
+                    continue
+                with open(path, "r") as f:
+                    for line in f:
+                        try:
+                            row = json.loads(line)
+                            self.add_tape(row["identifier"], row["date"], row["venue"], row["coverage"])
+                        except (ValueError, KeyError, TypeError):
+                            continue
+
+    def add(self, date, *fields):
+        """Add date to the place made of fields (eg. venue, city, state, or one "venue, city, state" string)"""
+        text = ",".join(x for x in fields if isinstance(x, str))
+        place = ", ".join(x.strip() for x in text.split(",") if x.strip())
+        if len(place) == 0 or len(date) == 0:
+            return
+        if place not in self._places:
+            self._places[place] = set()
+            for word in self.words(place):
+                if word not in self._words:
+                    self._words[word] = set()
+                    self._sorted_words = []
+                self._words[word].add(place)
+        self._places[place].add(date[:10])
+
+    def add_tape(self, identifier, date, venue, coverage):
+        if identifier in self._indexed:
+            return False
+        self._indexed.add(identifier)
+        self.add(date, venue, coverage)
+        return True
+
+    def record_tape(self, tape):
+        """Index (and record) the venue of a tape whose metadata has just been loaded"""
+        if not (tape.venue_name or tape.coverage):
+            return
+        self.index_pending()
+        if not self.add_tape(tape.identifier, tape.date, tape.venue_name, tape.coverage):
+            return
+        row = {"identifier": tape.identifier, "date": tape.date, "venue": tape.venue_name, "coverage": tape.coverage}
+        try:
+            with open(os.path.join(tape.dbpath, self.FILENAME), "a") as f:
+                f.write(json.dumps(row) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to record the venue of {tape.identifier}: {e}")
+
+    def matching_words(self, prefix):
+        """The indexed words which start with prefix"""
+        self.index_pending()
+        if len(self._sorted_words) != len(self._words):
+            self._sorted_words = sorted(self._words)
+        i = bisect_left(self._sorted_words, prefix)
+        j = bisect_left(self._sorted_words, prefix + "\uffff")
+        return self._sorted_words[i:j]
+
+    def next_chars(self, prefix):
+        """The characters which can follow prefix in a word, for spelling a query with a knob"""
+        prefix = prefix.lower()
+        return sorted({w[len(prefix)] for w in self.matching_words(prefix) if len(w) > len(prefix)})
+
+    def search(self, query):
+        """{place: sorted dates} of the places matching every word of query"""
+        places = None
+        for word in self.words(query):
+            matches = set().union(*(self._words[w] for w in self.matching_words(word)))
+            places = matches if places is None else places & matches
+        return {place: sorted(self._places[place]) for place in sorted(places or [])}
+
+    def dates(self, query):
+        return sorted(set().union(*self.search(query).values()))
+
+
+VENUES = VenueIndex()
+
+
+class MetadataStore:
+    """The metadata of the tapes, in one sqlite file in dbpath.
+
+    Only the fields used by the player are kept (see slim), as zlib-compressed json. When the store grows beyond
+    quota_mb (default METADATA_QUOTA_MB, 0 means no limit), the least recently read tapes are dropped. The read times
+    are kept in memory, and written every FLUSH_SECONDS, before an eviction and when the store is closed (at exit).
+    The database is only opened when it is first used. The per-tape json files of older versions
+    (dbpath/<year>/<month>/<id>.json) are moved into the store by a background thread, once the player calls
+    start_migration. A tape which is read before its file has been moved is moved at once.
+
+    The store also remembers the tapes which can not be played (see mark_bad), for BAD_TAPE_TTL_DAYS, so that they
+    are skipped without downloading them again after a restart, and the break map of each tape (see GDTape.break_map),
+    which is dropped whenever the tape's metadata changes.
+    """
+
+    FILENAME = "metadata.sqlite"
+    FILE_FIELDS = ("name", "source", "original", "format", "title", "track", "size", "length")
+    TRACK_FIELDS = ("set", "venue_name", "venue_location", "title", "position", "duration", "mp3")
+    FLUSH_SECONDS = 60
+
+    def __init__(self, dbpath, quota_mb=None):
+        self.dbpath = dbpath
+        self.path = os.path.join(dbpath, self.FILENAME)
+        quota_mb = getattr(config, "optd", {}).get("METADATA_QUOTA_MB", 0) if quota_mb is None else quota_mb
+        self.quota = int(quota_mb) * 2**20
+        self.evicted = 0
+        self._db = None
+        self._size = None
+        self._bad = None  # identifier -> expiry time
+        self._accessed = {}  # identifier -> read time, not yet written
+        self._flushed = time.time()
+        self._legacy = {}  # identifier -> json file of an older version, not yet moved into the store
+        self._migrator = None
+        self._lock = RLock()
+
+    @property
+    def db(self):
+        with self._lock:
+            if self._db is None:
+                self.connect()
+        return self._db
+
+    def connect(self):
+        """Open (or create) the database"""
+        os.makedirs(self.dbpath, exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (identifier TEXT PRIMARY KEY, data BLOB NOT NULL, "
+            "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS meta_accessed ON meta (accessed)")
+        db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS bad (identifier TEXT PRIMARY KEY, reason TEXT, stamp REAL NOT NULL, ttl REAL NOT NULL)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS breaks (identifier TEXT PRIMARY KEY, version INTEGER, data TEXT NOT NULL)")
+        db.commit()
+        self._db = db
+        atexit.register(self.close)  # write the read times
+
+    def start_migration(self):
+        """Start moving the per-tape json files of older versions into the store, in the background, unless it is done"""
+        with self._lock:
+            if self._migrator is not None:
+                return
+            if self.db.execute("SELECT value FROM info WHERE key = 'migrated'").fetchone() is not None:
+                return
+            self._legacy = {os.path.basename(path)[: -len(".json")]: path for path in self.legacy_paths()}
+            self._migrator = Thread(target=self.migrate, name="migrate metadata", daemon=True)
+            self._migrator.start()
+
+    def close(self):
+        """Write the read times, and close the database"""
+        with self._lock:
+            if self._db is None:
+                return
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    @classmethod
+    def slim(cls, page_meta):
+        """The fields of an archive.org (or phish.in) response which the player uses. The derived files are kept only
+        in the formats which may be played, whatever PLAY_LOSSLESS is, so that the option can change later."""
+        if "files" in page_meta:
+            metadata = page_meta.get("metadata", {})
+            files = [
+                {k: f[k] for k in cls.FILE_FIELDS if k in f}
+                for f in page_meta["files"]
+                if f.get("source") == "original" or f.get("format") in ANY_PLAYABLE_FORMATS
+            ]
+            slim = {"files": files, "metadata": {k: metadata[k] for k in ("venue", "coverage") if k in metadata}}
+            if "created" in page_meta:
+                slim["created"] = page_meta["created"]
+            return slim
+        if "data" in page_meta and "tracks" in page_meta["data"]:
+            data = page_meta["data"]
+            tracks = [{k: t[k] for k in cls.TRACK_FIELDS if k in t} for t in data["tracks"]]
+            return {"total_pages": page_meta.get("total_pages", 1), "data": {"date": data.get("date"), "tracks": tracks}}
+        return page_meta
+
+    def __contains__(self, identifier):
+        with self._lock:
+            if self.db.execute("SELECT 1 FROM meta WHERE identifier = ?", (identifier,)).fetchone() is not None:
+                return True
+            return identifier in self._legacy
+
+    def get(self, identifier):
+        """The metadata of identifier, or None if it is not in the store"""
+        with self._lock:
+            row = self.db.execute("SELECT data FROM meta WHERE identifier = ?", (identifier,)).fetchone()
+            if row is None:
+                return self.migrate_one(identifier) if identifier in self._legacy else None
+            now = time.time()
+            self._accessed[identifier] = now
+            if now - self._flushed > self.FLUSH_SECONDS:
+                self.flush()
+        try:
+            return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        except (zlib.error, ValueError) as e:
+            logger.warning(f"Dropping corrupt metadata of {identifier}: {e}")
+            self.delete(identifier)
+            return None
+
+    def put(self, identifier, page_meta, commit=True):
+        data = zlib.compress(json.dumps(self.slim(page_meta), separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            db = self.db
+            old = db.execute("SELECT size FROM meta WHERE identifier = ?", (identifier,)).fetchone()
+            db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?)", (identifier, data, len(data), time.time()))
+            db.execute("DELETE FROM breaks WHERE identifier = ?", (identifier,))
+            if commit:
+                db.commit()
+            self._size = self.total_size() if self._size is None else self._size + len(data) - (old[0] if old else 0)
+            if self.quota > 0 and self._size > self.quota:
+                self.evict()
+
+    def delete(self, identifier):
+        with self._lock:
+            self.db.execute("DELETE FROM meta WHERE identifier = ?", (identifier,))
+            self.db.execute("DELETE FROM breaks WHERE identifier = ?", (identifier,))
+            self.db.commit()
+            self._size = None
+
+    def flush(self):
+        """Write the read times kept since the last flush"""
+        with self._lock:
+            accessed = [(t, identifier) for identifier, t in self._accessed.items()]
+            self._accessed = {}
+            self._flushed = time.time()
+            if len(accessed) > 0:
+                self.db.executemany("UPDATE meta SET accessed = ? WHERE identifier = ?", accessed)
+                self.db.commit()
+
+    def total_size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM meta").fetchone()[0]
+
+    def evict(self):
+        """Drop the least recently read tapes until the store is back under 90% of its quota. Called with the lock held."""
+        target = int(0.9 * self.quota)
+        self.flush()
+        rows = self.db.execute("SELECT identifier, size FROM meta ORDER BY accessed").fetchall()
+        evicted = []
+        for identifier, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((identifier,))
+            self._size = self._size - size
+        self.db.executemany("DELETE FROM meta WHERE identifier = ?", evicted)
+        self.db.executemany("DELETE FROM breaks WHERE identifier = ?", evicted)
+        self.db.commit()
+        self.evicted = self.evicted + len(evicted)
+        logger.info(f"Evicted the metadata of {len(evicted)} tapes from {self.path}")
+
+    def get_breaks(self, identifier, version):
+        """The break map of identifier, or None if it is not stored for this version (see GDTape.break_version)"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT data FROM breaks WHERE identifier = ? AND version = ?", (identifier, version)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put_breaks(self, identifier, version, breaks):
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO breaks VALUES (?, ?, ?)", (identifier, version, json.dumps(breaks)))
+            self.db.commit()
+
+    def bad_identifiers(self):
+        """identifier -> expiry time of the tapes which are known to be unplayable. Expired entries are dropped."""
+        with self._lock:
+            if self._bad is None:
+                now = time.time()
+                self.db.execute("DELETE FROM bad WHERE stamp + ttl < ?", (now,))
+                self.db.commit()
+                self._bad = {x[0]: x[1] + x[2] for x in self.db.execute("SELECT identifier, stamp, ttl FROM bad")}
+            return self._bad
+
+    def is_bad(self, identifier):
+        expiry = self.bad_identifiers().get(identifier)
+        return expiry is not None and expiry >= time.time()
+
+    def mark_bad(self, identifier, reason, ttl_days=None):
+        """Remember that identifier can not be played, for ttl_days (default BAD_TAPE_TTL_DAYS)"""
+        ttl_days = getattr(config, "optd", {}).get("BAD_TAPE_TTL_DAYS", 30) if ttl_days is None else ttl_days
+        stamp, ttl = time.time(), float(ttl_days) * 86400
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO bad VALUES (?, ?, ?, ?)", (identifier, reason, stamp, ttl))
+            self.db.commit()
+            self.bad_identifiers()[identifier] = stamp + ttl
+        logger.info(f"Marked {identifier} as bad ({reason}) for {ttl_days} days")
+
+    def clear_bad(self, identifier):
+        with self._lock:
+            self.db.execute("DELETE FROM bad WHERE identifier = ?", (identifier,))
+            self.db.commit()
+            self.bad_identifiers().pop(identifier, None)
+
+    def legacy_paths(self):
+        """The per-tape json files of older versions: dbpath/<year>/<month>/<id>.json"""
+        for year in [x for x in os.listdir(self.dbpath) if x.isdigit()]:
+            for month in [x for x in os.listdir(os.path.join(self.dbpath, year)) if x.isdigit()]:
+                month_dir = os.path.join(self.dbpath, year, month)
+                for filename in [x for x in os.listdir(month_dir) if x.endswith(".json")]:
+                    yield os.path.join(month_dir, filename)
+
+    def migrate(self):
+        """Move the per-tape json files into the store, one at a time, so that readers are not held up for long"""
+        n_moved = 0
+        for identifier in list(self._legacy):
+            n_moved = n_moved + (self.migrate_one(identifier) is not None)
+        with self._lock:
+            if self._db is None:  # closed
+                return
+            self._db.execute("INSERT OR REPLACE INTO info VALUES ('migrated', ?)", (str(time.time()),))
+            self._db.commit()
+        if n_moved > 0:
+            logger.info(f"Moved the metadata of {n_moved} tapes into {self.path}")
+
+    def migrate_one(self, identifier):
+        """Move the json file of identifier into the store. Returns its metadata, or None if it could not be moved."""
+        with self._lock:
+            path = self._legacy.pop(identifier, None)
+            if path is None or self._db is None:
+                return None
+            try:
+                page_meta = json.load(open(path, "r"))
+                self.put(identifier, page_meta)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to migrate {path}: {e}")
+                return None
+            os.remove(path)
+            for directory in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+                if len(os.listdir(directory)) == 0:
+                    os.rmdir(directory)
+        return self.slim(page_meta)
+
+
+META_STORES = {}
+
+
+def metadata_store(dbpath):
+    """The MetadataStore of dbpath, shared by the process"""
+    store = META_STORES.get(dbpath)
+    if store is None:
+        store = META_STORES.setdefault(dbpath, MetadataStore(dbpath))
+    return store
+
+
+class LazyTapeList(MutableSequence):
+    """A list of tapes which may hold TapeRefs. Each ref is turned into its tape by the archive when it is touched.
+
+    The refs are kept, so that the archive can drop tapes to save memory and build them again when needed.
+    If order is given, it is applied to the list of tapes the first time the list is read,
+    so that scores are only computed for dates which are used.
+    """
+
+    def __init__(self, items=(), order=None):
+        self._items = list(items)
+        self._order = order  # None once the order has been applied
+        self.order = order
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _tape(self, i):
+        item = self._items[i]
+        return item.tape() if isinstance(item, TapeRef) else item
+
+    def _ensure_ordered(self):
+        if self._order is None:
+            return
+        order = self._order
+        self._order = None
+        tapes = [self._tape(i) for i in range(len(self._items))]
+        items = {id(tape): item for tape, item in zip(tapes, self._items)}
+        try:
+            self._items = [items[id(tape)] for tape in order(tapes)]
+        except Exception as e:
+            logger.exception(f"{e}")
+            logger.warning(f"Failed to sort tapes {tapes}")
+
+    def __getitem__(self, i):
+        self._ensure_ordered()
+        if isinstance(i, slice):
+            return [self._tape(j) for j in range(*i.indices(len(self._items)))]
+        return self._tape(i)
+
+    def __setitem__(self, i, tape):
+        self._ensure_ordered()
+        self._items[i] = tape
+
+    def __delitem__(self, i):
+        self._ensure_ordered()
+        del self._items[i]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        self._ensure_ordered()
+        for i in range(len(self._items)):
+            yield self._tape(i)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def insert(self, i, tape):
+        self._ensure_ordered()
+        self._items.insert(i, tape)
+
+    def refs(self):
+        """The members of the list, without building tapes or ordering them"""
+        return list(self._items)
+
+    def updated(self, items):
+        """This list if items are its members, else a list of items. The order of any unchanged list is kept."""
+        if len(items) != len(self._items):
+            return LazyTapeList(items, order=self.order)
+        mine = {id(x) for x in self._items}
+        if all(id(x) in mine for x in items):
+            return self
+        position = {x.identifier: i for i, x in enumerate(self._items)}
+        if any(x.identifier not in position for x in items):
+            return LazyTapeList(items, order=self.order)
+        # The same tapes, from a reload. Keep the order, which may have been computed already.
+        lis = LazyTapeList(sorted(items, key=lambda x: position[x.identifier]), order=self.order)
+        lis._order = self._order
+        return lis
+
+    @classmethod
+    def merge(cls, lists, order=None):
+        """Concatenate lazy lists, dropping tapes already in an earlier list.
+
+        Each part keeps its own ordering, then order is applied to the whole.
+        """
+        items = []
+        parts = []
+        seen = set()
+        for lis in lists:
+            part_items = TAPES.fold(lis._items, seen) if len(lists) > 1 else lis._items
+            parts.append((len(items), len(items) + len(part_items), lis._order))
+            items.extend(part_items)
+
+        def merged_order(tapes):
+            ordered = []
+            for start, end, part_order in parts:
+                part = tapes[start:end]
+                ordered.extend(part_order(part) if part_order else part)
+            return order(ordered) if order else ordered
+
+        return cls(items, order=merged_order)
+
+
+class MergedDateIndex(Mapping):
+    """The tape_dates of several archives, merged one date at a time.
+
+    The members of each date stay in their archives' lists. The merged list of a date is only built (and ordered)
+    when the date is first used. It is kept until one of the archives' lists for that date changes.
+    """
+
+    def __init__(self, archives, order=None):
+        self.archives = archives
+        self.order = order
+        self._memo = {}  # date -> (member lists, merged list)
+        self._sources = []
+        self._dates = set()
+
+    def refresh(self):
+        """Pick up the archives' current tape_dates. Only the dates whose lists have changed will be merged again."""
+        self._sources = [a.tape_dates for a in self.archives]
+        self._dates = set().union(*self._sources)
+        self._memo = {k: v for k, v in self._memo.items() if k in self._dates}
+
+    def __getitem__(self, date):
+        members = [td[date] for td in self._sources if date in td]
+        if len(members) == 0:
+            raise KeyError(date)
+        memo = self._memo.get(date)
+        if memo is not None and len(memo[0]) == len(members) and all(a is b for a, b in zip(memo[0], members)):
+            return memo[1]
+        merged = LazyTapeList.merge(members, order=self.order)
+        self._memo[date] = (members, merged)
+        return merged
+
+    def __contains__(self, date):
+        return date in self._dates
+
+    def __iter__(self):
+        return iter(self._dates)
+
+    def __len__(self):
+        return len(self._dates)
+
+    def invalidate(self, dates=None):
+        """Forget the merged lists of dates (default: all), eg. after their tapes have been changed in place"""
+        for date in self._memo.keys() if dates is None else dates:
+            self._memo.pop(date, None)
+
+
+class CalendarIndex:
+    """The dates of an archive as sorted day numbers, for the knobs. Rebuilt whenever the dates change.
+
+    Lookups bisect the day numbers. The artists of a date are found once, and kept until the tapes of the date change
+    or some of them are removed (see forget). The memo is not carried over when the index is rebuilt.
+    """
+
+    def __init__(self, dates, tape_dates, years):
+        self.dates = list(dates)
+        self.days = array.array("l", (datetime.date.fromisoformat(d[:10]).toordinal() for d in self.dates))
+        self.years = sorted(years)
+        self._tape_dates = tape_dates
+        self._artists = {}  # date -> (tapes, artists)
+        self.month_days = {}  # "MM-DD" -> sorted years with tapes on that day
+        for d in self.dates:
+            self.month_days.setdefault(d[5:10], []).append(int(d[:4]))
+
+    def __len__(self):
+        return len(self.days)
+
+    def next_date(self, date):
+        """The first date after date (a datetime.date), wrapping around at the end. None if there are no dates."""
+        if len(self.days) == 0:
+            return None
+        i = bisect_right(self.days, date.toordinal())
+        return datetime.date.fromordinal(self.days[i % len(self.days)])
+
+    def previous_date(self, date):
+        """The last date before date, wrapping around at the start. None if there are no dates."""
+        if len(self.days) == 0:
+            return None
+        i = bisect_left(self.days, date.toordinal()) - 1
+        return datetime.date.fromordinal(self.days[i])
+
+    def dates_after(self, date):
+        """Every date string, starting after date and wrapping around"""
+        start = bisect_right(self.days, date.toordinal())
+        for i in range(len(self.dates)):
+            yield self.dates[(start + i) % len(self.dates)]
+
+    def years_on(self, month, day):
+        """The years with tapes on month/day"""
+        return self.month_days.get(f"{month:0>2d}-{day:0>2d}", [])
+
+    def next_year_on(self, month, day, year):
+        """The first year after year with tapes on month/day, wrapping around. None if there are none."""
+        years = self.years_on(month, day)
+        if len(years) == 0:
+            return None
+        return years[bisect_right(years, year) % len(years)]
+
+    def artists(self, date):
+        """The artists with tapes on date (a string), in the order of the tapes"""
+        if date not in self._tape_dates:
+            return []
+        tapes = self._tape_dates[date]
+        memo = self._artists.get(date)
+        if memo is None or memo[0] is not tapes:
+            memo = (tapes, list(dict.fromkeys(t.artist for t in tapes if not t._remove_from_archive)))
+            self._artists[date] = memo
+        return memo[1]
+
+    def forget(self, date):
+        """Find the artists of date again when next asked, eg. after some of its tapes were removed"""
+        self._artists.pop(date, None)
+
+
+class ArtistIndex:
+    """The dates of each artist, sorted, and the tapes (or TapeRefs) of each artist on each date.
+
+    artist_of maps a tape to its artist. update is given the {date: tapes} of the archive, and only re-indexes the dates
+    whose lists have changed since the last update.
+    """
+
+    def __init__(self, artist_of):
+        self.artist_of = artist_of
+        self._sources = {}  # date -> (tapes, artists)
+        self._dates = {}  # artist -> sorted dates
+        self._tapes = {}  # (artist, date) -> tapes
+
+    def __len__(self):
+        return len(self._dates)
+
+    def __contains__(self, artist):
+        return artist in self._dates
+
+    def artists(self):
+        return list(self._dates.keys())
+
+    def dates(self, artist):
+        return self._dates.get(artist, [])
+
+    def update(self, date_tapes):
+        for date in [d for d, source in self._sources.items() if date_tapes.get(d) is not source[0]]:
+            self._remove(date)
+        for date, tapes in date_tapes.items():
+            if date not in self._sources:
+                self._add(date, tapes)
+
+    def _add(self, date, tapes):
+        artists = []
+        for tape in tapes:
+            artist = self.artist_of(tape)
+            key = (artist, date)
+            if key not in self._tapes:
+                self._tapes[key] = []
+                artists.append(artist)
+                dates = self._dates.setdefault(artist, [])
+                dates.insert(bisect_left(dates, date), date)
+            self._tapes[key].append(tape)
+        self._sources[date] = (tapes, artists)
+
+    def _remove(self, date):
+        _, artists = self._sources.pop(date)
+        for artist in artists:
+            self._drop(artist, date)
+
+    def _drop(self, artist, date):
+        del self._tapes[(artist, date)]
+        dates = self._dates[artist]
+        del dates[bisect_left(dates, date)]
+        if len(dates) == 0:
+            del self._dates[artist]
+
+    def clear(self):
+        """Forget every date, so that the next update indexes them all again"""
+        self._sources = {}
+        self._dates = {}
+        self._tapes = {}
+
+    def discard(self, date, identifier):
+        """Drop a tape which has been removed from the archive. An artist with no tapes left on date loses the date."""
+        source = self._sources.get(date)
+        if source is None:
+            return
+        for artist in list(source[1]):
+            tapes = [t for t in self._tapes[(artist, date)] if t.identifier != identifier]
+            self._tapes[(artist, date)] = tapes
+            if len(tapes) == 0:
+                source[1].remove(artist)
+                self._drop(artist, date)
+
+    def next_date(self, artist, date):
+        """The first date of artist after date (a string), wrapping around at the end. None if the artist has no dates."""
+        dates = self._dates.get(artist)
+        if not dates:
+            return None
+        return dates[bisect_right(dates, date) % len(dates)]
+
+    def between(self, start, end):
+        """{artist: tapes} of the dates from start to end (strings, inclusive)"""
+        artist_tapes = {}
+        for artist, dates in self._dates.items():
+            i, j = bisect_left(dates, start), bisect_right(dates, end)
+            if i < j:
+                artist_tapes[artist] = [t for date in dates[i:j] for t in self._tapes[(artist, date)]]
+        return artist_tapes
+
+
+class TimelineIndex:
+    """The shows of an archive as intervals of time, to find what was playing at a given moment.
+
+    A show starts at the start time of its set data, or else at default_start, and lasts three hours.
+    The intervals are built at the first lookup, and again only when default_start changes.
+    """
+
+    LENGTH = 3 * 3600
+
+    def __init__(self, dates, artists):
+        self.dates = list(dates)
+        self.artists = artists
+        self.default_start = None
+        self._set_starts = None
+        self._starts = array.array("q")  # seconds, sorted
+        self._order = []  # position in dates of each start
+        self._positions = {}
+
+    @staticmethod
+    def seconds(dt):
+        return dt.toordinal() * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+    def set_start(self, date):
+        for artist in self.artists:
+            if (artist, date) in SET_BREAKS.rows:
+                start_time = SET_BREAKS.get_date(artist, date).start_time
+                if start_time is not None:
+                    return start_time
+        return None
+
+    def build(self, default_start):
+        if self._set_starts is None:
+            self._set_starts = [self.set_start(d) for d in self.dates]
+            self._positions = {d: i for i, d in enumerate(self.dates)}
+        self.default_start = default_start
+        starts = [self.seconds(self.start_at(i, default_start)) for i in range(len(self.dates))]
+        self._order = sorted(range(len(starts)), key=starts.__getitem__)
+        self._starts = array.array("q", (starts[i] for i in self._order))
+
+    def start_at(self, i, default_start):
+        date = datetime.date.fromisoformat(self.dates[i][:10])
+        return datetime.datetime.combine(date, self._set_starts[i] or default_start)
+
+    def start(self, date, default_start):
+        """The start (a datetime) of the show on date (a string). None if there is none."""
+        if default_start != self.default_start:
+            self.build(default_start)
+        i = self._positions.get(date)
+        return None if i is None else self.start_at(i, default_start)
+
+    def dates_at(self, dt, default_start):
+        """The dates of the shows which were playing at dt (a datetime), the latest start first"""
+        if default_start != self.default_start:
+            self.build(default_start)
+        t = self.seconds(dt)
+        dates = []
+        j = bisect_right(self._starts, t) - 1  # the last show which started by dt
+        while j >= 0 and t < self._starts[j] + self.LENGTH:
+            dates.append(self.dates[self._order[j]])
+            j = j - 1
+        return dates
+
+    def date_at(self, dt, default_start):
+        """The date of the show which was playing at dt (a datetime). None if there was none."""
+        dates = self.dates_at(dt, default_start)
+        return dates[0] if dates else None
+
+
 class PhishinTapeDownloader(BaseTapeDownloader):
     """Synchronous Phishin Tape Downloader"""
 
     def __init__(self, url="https://phish.in", collection_list="Phish"):
+        super().__init__()
         self.url = url
         self.api = f"{self.url}/api/v1/shows"
         try:
@@ -646,6 +2537,7 @@ class IATapeDownloader(BaseTapeDownloader):
     """Synchronous Grateful Dead Tape Downloader"""
 
     def __init__(self, url="https://archive.org", collection_list="etree"):
+        super().__init__()
         self.url = url
         self.collection_list = collection_list
         self.api = f"{self.url}/services/search/v1/scrape"
@@ -675,6 +2567,20 @@ class IATapeDownloader(BaseTapeDownloader):
             "fields": ",".join(fields),
         }
 
+    def update_period_index(self, outpath, period_tapes):
+        try:
+            TapeIndex.build(outpath, period_tapes)
+        except Exception as e:
+            logger.warning(f"Failed to build tape index for {outpath}: {e}")
+
+    def period_ids(self, outpath):
+        index = TapeIndex.load(outpath)
+        if index is None:
+            return super().period_ids(outpath)
+        ids = {index.identifier(i) for i in range(len(index))}
+        index.close()
+        return ids
+
     def get_all_collection_names(self):
         collection_path = os.path.join(os.getenv("HOME"), ".etree_collection_names.json")
         if not os.path.exists(collection_path):
@@ -735,7 +2641,7 @@ class IATapeDownloader(BaseTapeDownloader):
         n_tapes_added = 0
         n_tapes_total = 0
         tapes = []
-        yearly_collections = ["etree", "georgeblood"]  # should this be in config?
+        yearly_collections = YEARLY_COLLECTIONS
         collection = collection if collection is not None else os.path.basename(iddir).replace("_ids", "")
 
         if not date_range:
@@ -876,6 +2782,7 @@ class LocalTapeDownloader(BaseTapeDownloader):
     """Synchronous Local Tape Downloader"""
 
     def __init__(self, url, collection_list=[]):
+        super().__init__()
         self.url = url
         self.api = self.url.replace("file://", "")
         self.parms = {"sort_attr": "date", "sort_dir": "desc"}
@@ -1007,15 +2914,14 @@ class PhishinArchive(BaseArchive):
             n_tapes = self.downloader.get_all_tapes(self.idpath)  # this will write chunks to folder
             if n_tapes > 0:
                 logger.info(f"Loaded {n_tapes} tapes from archive")
-        # loop over chunks -- get max addeddate before filtering collections.
+        # The rows are streamed from the chunks, so that only the PhishinTapes are ever held in memory.
         if os.path.isdir(self.idpath):
-            for filename in os.listdir(self.idpath):
-                if filename.endswith(".json"):
-                    chunk = json.load(open(os.path.join(self.idpath, filename), "r"))
-                    # chunk = [t for t in chunk if any(x in self.collection_list for x in t['collection'])]
-                    tapes.extend(chunk)
+            chunk_paths = [os.path.join(self.idpath, x) for x in os.listdir(self.idpath) if x.endswith(".json")]
+            journal = TapeJournal.read(self.idpath)
+            journal_rows = {k: v for rows in journal.values() for k, v in rows.items()}
+            tapes = TapeJournal.iter_merge((t for path in chunk_paths for t in iter_json_array(path)), journal_rows)
         else:
-            tapes = json.load(open(self.idpath, "r"))
+            tapes = iter_json_array(self.idpath)
             # addeddates.append(max([x['addeddate'] for x in tapes]))
             # tapes = [t for t in tapes if any(x in self.collection_list for x in t['collection'])]
         max_addeddate = None
@@ -1061,8 +2967,6 @@ class PhishinTape(BaseTape):
         self.collection = ["Phish"]
         self.artist = "Phish"
         delattr(self, "id")
-        date = to_date(self.date).date()
-        self.meta_path = os.path.join(self.dbpath, str(date.year), str(date.month), self.identifier + ".json")
         self.url_metadata = "https://phish.in/api/v1/shows/" + self.date
         try:
             self.apikey = open(os.path.join(os.getenv("HOME"), ".phishinkey"), "r").read().rstrip()
@@ -1084,12 +2988,13 @@ class PhishinTape(BaseTape):
     def get_metadata(self, only_if_cached=False):
         if self.meta_loaded:
             return
-        if only_if_cached and not os.path.exists(self.meta_path):
+        store = metadata_store(self.dbpath)
+        if only_if_cached and self.identifier not in store:
             return
         self._tracks = []
-        try:  # I used to check if file exists, but it may also be corrupt, so this is safer.
-            page_meta = json.load(open(self.meta_path, "r"))
-        except Exception:
+        page_meta = store.get(self.identifier)
+        downloaded = page_meta is None
+        if downloaded:
             parms = self.parms.copy()
             parms["page"] = 1
             r = requests.get(self.url_metadata, headers=self.headers)
@@ -1121,14 +3026,12 @@ class PhishinTape(BaseTape):
                 current_set = set_name
             self._tracks.append(PhishinTrack(track_data, self.identifier))
 
-        os.makedirs(os.path.dirname(self.meta_path), exist_ok=True)
-        json.dump(page_meta, open(self.meta_path, "w"), indent=2)
+        if downloaded:
+            store.put(self.identifier, page_meta)
         self.meta_loaded = True
         # return page_meta
         for track in self._tracks:
-            # track.title = re.sub(r"gd\d{2}(?:\d{2})?-\d{2}-\d{2}[ ]*([td]\d*)*", "", track.title).strip()
-            track.title = re.sub(r"^[a-zA-Z]{2,5}_*\d{2}(?:\d{2})?[-.]\d{2}[-.]\d{2}[ ]*([td]\d*)*", "", track.title).strip()
-            track.title = re.sub(r"(.flac)|(.mp3)|(.ogg)$", "", track.title).strip()
+            track.title = clean_title(track.title)
         return
 
 
@@ -1218,7 +3121,8 @@ class LocalArchive(BaseArchive):
         for meta_path in self.idpath:
             tapes = self.downloader.get_all_tapes(meta_path)
             all_tapes.extend(tapes)
-        self.tapes = [LocalTape(self.idpath, tape, self.set_data) for tape in all_tapes]
+        scope = tuple(self.idpath)
+        self.tapes = TAPES.fold([TAPES.add(LocalTape(self.idpath, tape, self.set_data), scope) for tape in all_tapes])
         return self.tapes
 
     def best_tape(self, date, resort=True):
@@ -1683,6 +3587,8 @@ class GDArchive(BaseArchive):
         with_latest=False,
         collection_list=["GratefulDead"],
         date_range=None,
+        n_load_workers=None,
+        paged=False,
     ):
         """Create a new GDArchive.
 
@@ -1693,19 +3599,42 @@ class GDArchive(BaseArchive):
           reload_ids: If True, force re-download of tape data
           with_latest: If True, query archive for recently added tapes, and append them.
           collection_list: A list of collections from archive.org
+          n_load_workers: Processes used to load the tapes. Default is the LOAD_WORKERS option (0: one per core)
+          paged: If True, only the tapes of the years around the year knob are kept built. See ensure_year.
         """
         super().__init__(url, dbpath, reload_ids, with_latest, collection_list, date_range)
         self.archive_type = "Internet Archive"
         self.set_data = GDSetBreaks(self.collection_list)
+        SCORES.load(self.dbpath)
+        SONGS.load(self.dbpath)
+        SONGS.add_set_rows(self.set_data.iter_rows())
+        VENUES.load(self.dbpath)
+        VENUES.add_set_rows(self.set_data.iter_rows())
+        self._bad_tapes = None
         self.date_range = date_range
+        self._tapes_by_id = {}
+        self.tape_scope = (self.dbpath, tuple(self.collection_list))  # the tapes are shared with archives of this scope
+        self._shards = OrderedDict()  # year -> identifiers of the built tapes, least recently used first
+        self._current_shard = None
+        self.tape_budget = config.optd.get("TAPE_MEMORY_BUDGET_MB", 0) * 2**20
+        self._resident_bytes = 0  # counted as the tapes are built and dropped, and recounted by enforce_budget
+        self.evicted_shards = 0
+        self._scanned_chunks = {}
+        self._date_refs = {}
+        self._ref_dates = []  # the sorted dates of _date_refs, replaced with it
+        self.artist_index = ArtistIndex(self.ref_artist)
+        self.n_load_workers = n_load_workers
+        self.paged = paged
+        self.page_window = 1  # years either side of the current year to keep built
+        self._window = None  # the years whose tapes are kept built, in paged mode
+        self._tape_lock = RLock()  # guards the built tapes and their shards, which the prefetcher also changes
+        self._prefetcher = None
+        self.sort_within = "georgeblood" not in self.collection_list
         self.load_archive(reload_ids, with_latest)
 
     def load_archive(self, reload_ids=False, with_latest=False):
         self.tapes = self.load_tapes(reload_ids, with_latest)
-        sort_within = True
-        if "georgeblood" in self.collection_list:
-            sort_within = False
-        self.tape_dates = self.get_tape_dates(sort_within=sort_within)
+        self.tape_dates = self.get_tape_dates(sort_within=self.sort_within)
         self.dates = sorted(self.tape_dates.keys())
 
     def resort_tape_date(self, date):  # IA
@@ -1714,10 +3643,14 @@ class GDArchive(BaseArchive):
             date = date.strftime("%Y-%m-%d")
         if date not in self.dates:
             return [None]
-        tapes = self.tape_dates[date]
+        all_tapes = list(self.tape_dates[date])
+        tapes = [t for t in all_tapes if not t._remove_from_archive]  # skip tapes known to be bad
         _ = [t.tracks() for t in tapes[:3]]  # load first 3 tapes' tracks. Decrease score of those without titles.
         tapes = sorted(tapes, key=methodcaller("compute_score"), reverse=True)
         tapes = [t for t in tapes if not t._remove_from_archive]  # eliminate missing tapes
+        for tape in all_tapes:
+            if tape._remove_from_archive:
+                self.artist_index.discard(date, tape.identifier)
         return tapes
 
     def best_tape(self, date, resort=True):  # IA
@@ -1735,18 +3668,23 @@ class GDArchive(BaseArchive):
 
     def load_current_tapes(self, reload_ids=False, meta_path=None):  # IA
         """Load current tapes or download them from archive.org if they are not already loaded"""
+        addeddates = []
+        tapes = list(self.iter_current_tapes(reload_ids, meta_path, addeddates))
+        max_addeddate = max(addeddates) if len(tapes) > 0 else None
+        return (tapes, max_addeddate)
+
+    def iter_current_tapes(self, reload_ids=False, meta_path=None, addeddates=None):  # IA
+        """Yield a TapeRef for each current tape, downloading them from archive.org if they are not already loaded.
+
+        The max addeddate of each chunk is appended to addeddates as the chunk is read.
+        """
         logger.debug("Loading current tapes")
         meta_path = self.idpath if meta_path is None else meta_path
-        tapes = []
-        addeddates = []
+        addeddates = [] if addeddates is None else addeddates
         collection_path = os.path.join(os.getenv("HOME"), ".etree_collection_names.json")
-        yearly_collections = ["etree", "georgeblood"]  # should this be in config?
+        yearly_collections = YEARLY_COLLECTIONS
 
-        if not self.date_range:
-            self.date_range = [1880, datetime.datetime.now().year]
-        elif isinstance(self.date_range, int):
-            self.date_range = [self.date_range]
-        years_to_load = range(min(self.date_range), max(self.date_range) + 1) if len(self.date_range) <= 2 else self.date_range
+        years_to_load = self.years_to_load()
 
         meta_files = os.listdir(meta_path) if os.path.exists(meta_path) else []
         meta_files = [x for x in meta_files if x.endswith(".json")]
@@ -1772,34 +3710,105 @@ class GDArchive(BaseArchive):
             except Exception as e:
                 logger.warning(f"Error saving all collection_names {e}")
         # loop over chunks -- get max addeddate before filtering collections.
-        if os.path.isdir(meta_path):
+        if not os.path.isdir(meta_path):
+            yield from self.iter_chunk_rows(iter_json_array(meta_path), addeddates)
+            return
+        journal = TapeJournal.read(meta_path)
+        for filename in os.listdir(meta_path):
+            if filename.endswith(".json"):
+                time_period = int(filename.split("_")[-1].replace(".json", ""))
+                # if min_year <= time_period <= max_year:
+                if time_period in years_to_load:
+                    logger.debug(f"loading time period {time_period}")
+                    chunk_path = os.path.join(meta_path, filename)
+                    journal_rows = journal.get(str(time_period), {})
+                    scanned = self._scanned_chunks.pop(chunk_path, None)
+                    index = TapeIndex.load(chunk_path)
+                    if index is None:
+                        rows = TapeJournal.iter_merge(iter_json_array(chunk_path), journal_rows)
+                        yield from self.iter_chunk_rows(rows, addeddates)
+                        continue
+                    source = (index.header["source_mtime_ns"], index.header["source_size"])
+                    if scanned is not None and scanned[:2] == source:
+                        max_addeddate = scanned[2]
+                        row_numbers = array.array("I")
+                        row_numbers.frombytes(scanned[3])
+                    else:
+                        max_addeddate = index.max_addeddate() if len(index) > 0 else None
+                        row_numbers = index.row_numbers(self.collection_list)
+                    if max_addeddate is not None:
+                        addeddates.append(max_addeddate)
+                    for i in row_numbers:
+                        if not journal_rows or index.identifier(i) not in journal_rows:  # journal rows replace index rows
+                            yield TapeRef(self, index, i)
+                    yield from self.iter_chunk_rows(journal_rows.values(), addeddates)
+
+    def iter_chunk_rows(self, rows, addeddates):
+        """Yield a TapeRef for each raw json row in collection_list, noting the max addeddate of all rows"""
+        max_addeddate = None
+        for t in rows:
+            max_addeddate = t["addeddate"] if max_addeddate is None else max(max_addeddate, t["addeddate"])
+            if any(x in self.collection_list for x in t["collection"]):
+                yield TapeRef(self, None, t)
+        if max_addeddate is not None:
+            addeddates.append(max_addeddate)
+
+    def years_to_load(self):
+        if not self.date_range:
+            self.date_range = [1880, datetime.datetime.now().year]
+        elif isinstance(self.date_range, int):
+            self.date_range = [self.date_range]
+        return range(min(self.date_range), max(self.date_range) + 1) if len(self.date_range) <= 2 else self.date_range
+
+    def scan_chunks(self):
+        """Rebuild the stale tape indexes of the chunks to be loaded, in a pool of processes.
+
+        The row numbers selected in each of those chunks are kept for load_current_tapes, which then only maps the index.
+        With one worker (eg. on a single-core board), or when at most one index is stale, no pool is started, and the
+        chunks are loaded serially.
+        """
+        self._scanned_chunks = {}
+        n_workers = load_workers(self.n_load_workers)
+        years_to_load = self.years_to_load()
+        chunk_paths = []
+        for meta_path in self.idpath:
+            if not os.path.isdir(meta_path):
+                continue
             for filename in os.listdir(meta_path):
-                if filename.endswith(".json"):
-                    time_period = int(filename.split("_")[-1].replace(".json", ""))
-                    # if min_year <= time_period <= max_year:
-                    if time_period in years_to_load:
-                        logger.debug(f"loading time period {time_period}")
-                        chunk = json.load(open(os.path.join(meta_path, filename), "r"))
-                        addeddates.append(max([x["addeddate"] for x in chunk]))
-                        chunk = [t for t in chunk if any(x in self.collection_list for x in t["collection"])]
-                        tapes.extend(chunk)
-        else:
-            tapes = json.load(open(meta_path, "r"))
-            addeddates.append(max([x["addeddate"] for x in tapes]))
-            tapes = [t for t in tapes if any(x in self.collection_list for x in t["collection"])]
-        max_addeddate = max(addeddates) if len(tapes) > 0 else None
-        return (tapes, max_addeddate)
+                if filename.endswith(".json") and int(filename.split("_")[-1].replace(".json", "")) in years_to_load:
+                    chunk_paths.append(os.path.join(meta_path, filename))
+        if n_workers <= 1:
+            return
+        chunk_paths = [x for x in chunk_paths if TapeIndex.is_stale(x)]
+        if len(chunk_paths) <= 1:
+            return
+        start = time.time()
+        try:
+            with ProcessPoolExecutor(max_workers=min(n_workers, len(chunk_paths)), mp_context=load_pool_context()) as executor:
+                results = executor.map(scan_chunk, chunk_paths, repeat(self.collection_list))
+                self._scanned_chunks = {k: v for k, v in zip(chunk_paths, results) if v is not None}
+        except Exception as e:
+            logger.warning(f"Failed to scan chunks in parallel, loading serially: {e}")
+            self._scanned_chunks = {}
+        logger.debug(f"scanned {len(chunk_paths)} chunks with {n_workers} workers in {time.time() - start:.2f}s")
 
     def load_tapes(self, reload_ids=False, with_latest=False):  # IA
-        """Load the tapes, then add anything which has been added since the tapes were saved"""
+        """Load the tapes, then add anything which has been added since the tapes were saved
+
+        The tapes are streamed from the chunks straight into the date index (see get_tape_dates).
+        """
         logger.debug("begin loading tapes")
         all_tapes_count = 0
-        all_loaded_tapes = []
+        date_refs = {}
+        if not reload_ids:
+            self.scan_chunks()
         for meta_path in self.idpath:
             n_tapes = 0
-            loaded_tapes, max_addeddate = self.load_current_tapes(reload_ids, meta_path=meta_path)
-            if len(loaded_tapes) == 0:  # e.g. in case of an invalid collection
+            addeddates = []
+            loaded_dates = self.group_by_date(self.iter_current_tapes(reload_ids, meta_path, addeddates))
+            if len(loaded_dates) == 0:  # e.g. in case of an invalid collection
                 continue
+            max_addeddate = max(addeddates)
             logger.debug(f"max addeddate {max_addeddate}")
             if with_latest:
                 min_download_addeddate = (datetime.datetime.fromisoformat(max_addeddate[:-1])) - datetime.timedelta(hours=1)
@@ -1812,99 +3821,285 @@ class GDArchive(BaseArchive):
                     logger.info(f"Loaded {n_tapes} new tapes from archive {meta_path}")
             if n_tapes > 0:
                 logger.info(f"Adding {n_tapes} tapes")
-                loaded_tapes, _ = self.load_current_tapes(meta_path=meta_path)
-            all_loaded_tapes.extend(loaded_tapes)
+                loaded_dates = self.group_by_date(self.iter_current_tapes(meta_path=meta_path))
+            self.add_refs(date_refs, loaded_dates)
             all_tapes_count = all_tapes_count + n_tapes
         if (all_tapes_count == 0) and (len(self.tapes) > 0):  # The tapes have already been written, and nothing was added
             return self.tapes
-        self.tapes = [GDTape(self.dbpath, tape, self.set_data, self.collection_list) for tape in all_loaded_tapes]
+        # The GDTapes are only built when they are first touched. See make_tape.
+        self.set_date_refs(date_refs)
         return self.tapes
 
+    @staticmethod
+    def add_refs(date_refs, loaded_dates):
+        """Add the refs of loaded_dates to date_refs. A tape in more than one collection is only added once."""
+        for date, refs in loaded_dates.items():
+            if date in date_refs:
+                date_refs[date] = TAPES.fold(date_refs[date] + refs)
+            else:
+                date_refs[date] = refs
+
+    def set_date_refs(self, date_refs):
+        """Index the refs of each date. The dates whose lists are shared with the old index are not indexed again."""
+        ref_dates = sorted(date_refs)
+        with self._tape_lock:  # the prefetcher reads both
+            self._date_refs = date_refs
+            self._ref_dates = ref_dates
+        self.artist_index.update(date_refs)
+        self.tapes = LazyTapeList([ref for refs in date_refs.values() for ref in refs])
+
+    def ref_artist(self, ref):
+        """The artist of a TapeRef, by the same rule as GDTape, without building the tape"""
+        if len(self.collection_list) == 1:
+            return self.collection_list[0]
+        return collection_artist(ref.collection, self.collection_list)
+
+    def get_tape_dates(self, sort_within=None):  # IA
+        """The tapes were grouped by date as they were loaded, so there is no need to group self.tapes again"""
+        self.artist_index.update(self._date_refs)  # only the dates which have changed, or all of them after a clear
+        sort_within = self.sort_within if sort_within is None else sort_within
+        order = self.order_tapes if sort_within else None
+        if sort_within != self.sort_within or not isinstance(getattr(self, "tape_dates", None), dict):
+            self.tape_dates = {k: LazyTapeList(v, order=order) for k, v in self._date_refs.items()}
+            return self.tape_dates
+        # Keep the lists (and their order) of the dates which have not changed.
+        old = self.tape_dates
+        self.tape_dates = {
+            k: old[k].updated(v) if isinstance(old.get(k), LazyTapeList) else LazyTapeList(v, order=order)
+            for k, v in self._date_refs.items()
+        }
+        return self.tape_dates
+
+    def ensure_year(self, year):
+        """In paged mode, keep the tapes of the years around year built, and drop the tapes of the other years.
+
+        The date index always covers every year, so only the GDTapes are paged. They are built (and dropped)
+        by a background thread, so the knob never waits. A tape which is touched before its year is built is
+        built on the spot, as usual.
+        """
+        if not self.paged:
+            return
+        window = set(range(year - self.page_window, year + self.page_window + 1))
+        with self._tape_lock:
+            if window == self._window:
+                return
+            self._window = window
+            if self._prefetcher is None:
+                self._prefetcher = Thread(target=self._prefetch_tapes, daemon=True)
+                self._prefetcher.start()
+
+    def _prefetch_tapes(self):
+        """Drop the tapes of the years outside the window, then build the tapes of the window, nearest year first"""
+        done = None
+        while True:
+            with self._tape_lock:
+                window = self._window
+                if window == done:
+                    self._prefetcher = None
+                    return
+                for shard in [x for x in self._shards if int(x) not in window]:
+                    self.drop_shard(shard)
+                dates, date_refs = self._ref_dates, self._date_refs  # a consistent snapshot for this pass
+            stale = False
+            for year in sorted(window, key=lambda y: abs(y - (min(window) + self.page_window))):
+                start, end = bisect_left(dates, f"{year:04d}"), bisect_left(dates, f"{year + 1:04d}")
+                for date in dates[start:end]:
+                    stale = self._window != window or self._date_refs is not date_refs  # the knob or the refs moved on
+                    if stale:
+                        break
+                    for ref in date_refs.get(date, []):
+                        self.build_tape(ref)
+                if stale:
+                    break
+            done = None if stale else window
+
+    @property
+    def bad_tapes(self):
+        """identifier -> expiry time of the tapes known to be unplayable. Read from the metadata store once, when the
+        first tape is built, so that building tapes need not touch disk and an unused archive does not open the store."""
+        if self._bad_tapes is None:
+            self._bad_tapes = metadata_store(self.dbpath).bad_identifiers()
+        return self._bad_tapes
+
+    def make_tape(self, ref):
+        """Build the GDTape for a TapeRef. Each identifier is built once (see TAPES), even if it is loaded again by an update.
+
+        The tapes are held in shards by year. When the built tapes are over TAPE_MEMORY_BUDGET_MB, the least recently used
+        shards are dropped, and their tapes are built again from the refs when they are next touched. The budget counts
+        only the built tapes and their tracks, as estimated by tape_bytes: the refs and the date indexes are always resident.
+        """
+        with self._tape_lock:
+            tape = self.build_tape(ref)
+            self.touch_shard(tape.date[:4])
+        return tape
+
+    def build_tape(self, ref):
+        """The GDTape of ref, built if it is not built yet, without touching its shard"""
+        identifier = ref.identifier
+        with self._tape_lock:
+            tape = self._tapes_by_id.get(identifier)
+            if tape is None:
+                tape = TAPES.get(identifier, self.tape_scope)  # eg. built by another archive, or still in use after eviction
+                if tape is None:
+                    tape = GDTape(self.dbpath, ref.raw(), self.set_data, self.collection_list)
+                    tape = TAPES.add(tape, self.tape_scope)
+                if identifier in self.bad_tapes and metadata_store(self.dbpath).is_bad(identifier):
+                    tape._remove_from_archive = True
+                self._tapes_by_id[identifier] = tape
+                self._shards.setdefault(tape.date[:4], set()).add(identifier)
+                self._resident_bytes = self._resident_bytes + self.tape_bytes(tape)
+                if 0 < self.tape_budget < self._resident_bytes:
+                    self.enforce_budget(keep=tape.date[:4])
+        return tape
+
+    def touch_shard(self, shard):
+        if shard == self._current_shard:
+            return
+        self._current_shard = shard
+        self._shards.move_to_end(shard)
+        if self.tape_budget > 0:
+            self.enforce_budget()
+
+    def enforce_budget(self, keep=None):
+        """Drop the least recently used shards (but never the current one, or keep) until the built tapes fit in the budget.
+        The built tapes are recounted first, since their tracks are added when their metadata is read."""
+        with self._tape_lock:
+            self._resident_bytes = self.memory_stats()["resident_bytes"]
+            for shard in [x for x in self._shards if x not in (self._current_shard, keep)]:
+                if self._resident_bytes <= self.tape_budget:
+                    break
+                self.drop_shard(shard)
+                logger.debug(f"{self._resident_bytes} bytes resident")
+
+    def drop_shard(self, shard):
+        """Drop the built tapes of shard (a year), to be built again from their refs when touched. Returns the bytes freed."""
+        with self._tape_lock:
+            identifiers = self._shards.pop(shard, set())
+            freed = sum(self.tape_bytes(self._tapes_by_id.pop(identifier, None)) for identifier in identifiers)
+            self._resident_bytes = max(0, self._resident_bytes - freed)
+            self.evicted_shards = self.evicted_shards + 1
+        logger.debug(f"evicted {len(identifiers)} tapes of {shard}")
+        return freed
+
+    @staticmethod
+    def tape_bytes(tape):
+        """Estimated memory held by a built tape and its tracks (see RESIDENT_TAPE_BYTES). Not measured at run time."""
+        if tape is None:
+            return 0
+        return RESIDENT_TAPE_BYTES + RESIDENT_TRACK_BYTES * len(tape._tracks)
+
+    def memory_stats(self):
+        """Counters of the built tapes, for tuning TAPE_MEMORY_BUDGET_MB. The refs and indexes are not counted."""
+        tapes = list(self._tapes_by_id.values())
+        return {
+            "budget_bytes": self.tape_budget,
+            "resident_bytes": sum(self.tape_bytes(t) for t in tapes),
+            "resident_tapes": len(tapes),
+            "resident_tracks": sum(len(t._tracks) for t in tapes),
+            "resident_shards": len(self._shards),
+            "evicted_shards": self.evicted_shards,
+            "folded_tapes": TAPES.folded,
+        }
+
     def year_artists(self, year, other_year=None):
-        """NOTE: should use some caching here"""
-        id_dict = {}
+        """The tapes of each performer between year and other_year. The performer is taken from the identifier
+        (eg. 78_song_bing-crosby-orchestra_gbia1), and tapes whose identifier does not name one are left out."""
         other_year = other_year if other_year else year
         start_year, end_year = sorted([year, other_year])
-        year_tapes = {k: v for k, v in self.tape_dates.items() if start_year <= int(k[:4]) <= end_year}
-        logger.info(f"Select artists between {start_year} and {end_year}. There are {len(year_tapes)} tapes")
-
-        tapes = [item for sublist in year_tapes.values() for item in sublist]
-        kvlist = [(" ".join(x.identifier.split("_")[2].split("-")[:2]), x) for x in tapes]
-        for kv in kvlist:
-            id_dict.setdefault(kv[0], []).append(kv[1])
+        i, j = bisect_left(self.dates, f"{start_year:04d}"), bisect_right(self.dates, f"{end_year:04d}-99")
+        id_dict = {}
+        for date in self.dates[i:j]:
+            for ref in self._date_refs.get(date, []):
+                parts = ref.identifier.split("_")
+                if len(parts) < 3:
+                    continue
+                id_dict.setdefault(" ".join(parts[2].split("-")[:2]), []).append(self.build_tape(ref))
+        logger.info(f"Select artists between {start_year} and {end_year}. There are {len(id_dict)} artists")
         return id_dict
 
 
 class GDTape(BaseTape):
     """A Grateful Dead Identifier Item -- does not contain tracks"""
 
+    __slots__ = (
+        "identifier",
+        "date",
+        "set_data",
+        "venue_name",
+        "coverage",
+        "created_date",
+        "addeddate",
+        "avg_rating",
+        "num_reviews",
+        "downloads",
+        "download_rate",
+        "_collection_ids",
+        "_format_mask",
+    )
+
     def __init__(self, dbpath, raw_json, set_data, collection_list):
         super().__init__(dbpath, raw_json, set_data)
         self.meta_loaded = False
         self.venue_name = None
         self.coverage = None
+        self.created_date = None
         attribs = ["date", "identifier", "avg_rating", "format", "collection", "num_reviews", "downloads", "addeddate"]
         for k in attribs:
             if k in raw_json.keys():
                 setattr(self, k, raw_json[k])
 
-        # for k, v in raw_json.items():
-        #     if k in attribs:
-        #         setattr(self, k, v)
-        self.url_metadata = "https://archive.org/metadata/" + self.identifier
-        self.url_details = "https://archive.org/details/" + self.identifier
         if self.addeddate.startswith("0000"):
             self.addeddate = "1990-01-01T00:00:00Z"
         self.addeddate = datetime.datetime.fromisoformat(self.addeddate[:-1])
         if isinstance(self.date, list):
             self.date = self.date[0]
         self.date = self.date[:10]
-        colls = collection_list
-        self.artist = (
-            colls[min([colls.index(c) if c in colls else 100 for c in self.collection])] if len(colls) > 1 else colls[0]
-        )
+        self.artist = collection_artist(self.collection, collection_list)
         self.set_data = set_data.get_date(self.artist, self.date)
-        date = to_date(self.date).date()
-        self.meta_path = os.path.join(self.dbpath, str(date.year), str(date.month), self.identifier + ".json")
 
         self.avg_rating = float(raw_json.get("avg_rating", 2))
         self.num_reviews = int(raw_json.get("num_reviews", 1))
         self.downloads = int(raw_json.get("downloads", 1))
         self.download_rate = self.downloads / max(100, (datetime.datetime.now() - self.addeddate).days)
 
+    @property
+    def collection(self):
+        return COLLECTION_NAMES.from_ids(self._collection_ids)
+
+    @collection.setter
+    def collection(self, names):
+        self._collection_ids = COLLECTION_NAMES.ids(names or [])
+
+    @property
+    def format(self):
+        return FORMAT_NAMES.from_mask(self._format_mask)
+
+    @format.setter
+    def format(self, names):
+        self._format_mask = FORMAT_NAMES.mask(names or [])
+
+    @property
+    def url_metadata(self):
+        return "https://archive.org/metadata/" + self.identifier
+
+    @property
+    def url_details(self):
+        return "https://archive.org/details/" + self.identifier
+
+    def contains_sound(self):
+        return (self._format_mask & FORMAT_NAMES.mask(self._playable_formats)) > 0
+
     def stream_only(self):
-        return "stream_only" in self.collection
+        return STREAM_ONLY_ID in self._collection_ids
 
     def compute_score(self):
-        """compute a score for sorting the tape. High score means it should be played first"""
+        """compute a score for sorting the tape. High score means it should be played first. See ScoreEngine"""
         if self._remove_from_archive:
             return -1
-        score = 3
-        if self.stream_only():
-            score = score + 10
-        if "optd" in dir(config):
-            fav_taper = config.optd.get("FAVORED_TAPER", [])
-            if isinstance(fav_taper, str):
-                fav_taper = [fav_taper]
-            if isinstance(fav_taper, (list, tuple)):
-                fav_taper = {x: 1 for x in fav_taper}
-            if len(fav_taper) > 0:
-                for taper, points in fav_taper.items():
-                    if taper.lower() in self.identifier.lower():
-                        score = score + float(points)
-        self.get_metadata(only_if_cached=True)
-        if self.meta_loaded:
-            if not self.contains_sound():
-                self._remove_from_archive = True
-                return -1
-            score = score + 3 * (self.title_fraction() - 1)  # reduce score for tapes without titles.
-            score = score + min(20, len(self._tracks)) / 4
-        score = score + self.download_rate
-        score = score + math.log(1 + self.downloads)
-        score = score + 0.5 * (
-            self.avg_rating - 2.0 / math.sqrt(self.num_reviews)
-        )  # down-weigh avg_rating: it's usually about the show, not the tape.
-        return score
+        if self.meta_loaded and not self.contains_sound():
+            self.remove_from_archive(None, reason="no sound", remember=False)  # it depends on PLAY_LOSSLESS
+            return -1
+        return SCORES.score(self)
 
     def title_fraction(self):
         n_tracks = len(self._tracks)
@@ -1918,38 +4113,23 @@ class GDTape(BaseTape):
         )
         return (1 + n_known) / (1 + n_tracks)
 
-    def remove_from_archive(self, page_meta):
+    def remove_from_archive(self, page_meta, reason="no files", remember=True):
+        """Skip this tape, now and, if remember, after a restart (see MetadataStore.mark_bad).
+        Only reasons which do not depend on the options should be remembered."""
         self._remove_from_archive = True
-
-    def reorder_tracks(self, orig_tracknums):
-        try:
-            pre_sort_order = [x.track if x.track is not None else -1 for x in self._tracks]
-            if pre_sort_order == sorted(pre_sort_order):
-                return
-            tracknums_orig = {int(v): k for k, v in orig_tracknums.items()}
-            if len(tracknums_orig) < len(orig_tracknums):
-                return
-            # new_tracklist = [self._tracks[i] for i in sorted(range(len(pre_sort_order)), key=pre_sort_order.__getitem__)]
-            new_tracklist = []
-            for k in sorted(tracknums_orig.keys()):
-                filename = tracknums_orig[k]
-                for t in self._tracks:
-                    if os.path.splitext(t.files[0].get("name", ""))[0] == os.path.splitext(filename)[0]:
-                        new_tracklist.append(t)
-                        continue
-            self._tracks = new_tracklist
-        except:
-            pass
+        if remember:
+            metadata_store(self.dbpath).mark_bad(self.identifier, reason)
 
     def get_metadata(self, only_if_cached=False):
         if self.meta_loaded:
             return
-        if only_if_cached and not os.path.exists(self.meta_path):  # we don't have it cached, so return.
+        store = metadata_store(self.dbpath)
+        if only_if_cached and self.identifier not in store:  # we don't have it cached, so return.
             return
         self._tracks = []
-        try:  # I used to check if file exists, but it may also be corrupt, so this is safer.
-            page_meta = json.load(open(self.meta_path, "r"))
-        except Exception:
+        page_meta = store.get(self.identifier)
+        downloaded = page_meta is None
+        if downloaded:
             r = requests.get(self.url_metadata)
             logger.debug("url is {}".format(r.url))
             if r.status_code != 200:
@@ -1965,80 +4145,78 @@ class GDTape(BaseTape):
                 return
 
         # self.reviews = page_meta['reviews'] if 'reviews' in page_meta.keys() else []
-        orig_titles = {}
-        orig_tracknums = {}
         if "files" not in page_meta.keys():
             # This tape can not be played, and should be removed from the data.
             self.remove_from_archive(page_meta)
             return
         self.created_date = datetime.datetime.fromtimestamp(page_meta.get("created", 0)).date()
-        for ifile in page_meta["files"]:
-            try:
-                if ifile["source"] == "original":
-                    try:
-                        orig_titles[ifile["name"]] = (
-                            ifile["title"] if ("title" in ifile.keys() and ifile["title"] != "unknown") else ifile["name"]
-                        )
-                        if ifile.get("track", None):
-                            orig_tracknums[ifile["name"]] = ifile["track"]
-                        # orig_titles[ifile['name']] = re.sub(r'(.flac)|(.mp3)|(.ogg)$','', orig_titles[ifile['name']])
-                    except Exception as e:
-                        logger.exception(e)
-                        pass
-                if ifile["format"] in (self._lossy_formats if self.stream_only() else self._playable_formats):
-                    self.append_track(ifile, orig_titles, orig_tracknums)
-            except KeyError as e:
-                logger.warning("Error in parsing metadata")
-                raise (e)
-                pass
-            except Exception as e:  # TODO handle this!!!
-                raise (e)
-        self.reorder_tracks(orig_tracknums)
+        self._tracks = self.parse_files(page_meta["files"])
 
         try:
             self.venue_name = page_meta["metadata"]["venue"]
             self.coverage = page_meta["metadata"]["coverage"]
         except Exception:
-            # logger.warn(f"Failed to read venue, city, state from metadata. {self.meta_path}")
+            # logger.warn(f"Failed to read venue, city, state from metadata of {self.identifier}")
             pass
 
-        self.write_metadata(page_meta)
-
-        for track in self._tracks:
-            if not isinstance(track.title, (str, bytes)):
-                track.title = ""
-            # track.title = re.sub(r"gd\d{2}(?:\d{2})?-\d{2}-\d{2}[ ]*([td]\d*)*", "", track.title).strip()
-            track.title = re.sub(r"^[a-zA-Z]{2,5}_*\d{2}(?:\d{2})?[-.]\d{2}[-.]\d{2}[ ]*([td]\d*)*", "", track.title).strip()
-            track.title = re.sub(r"(.flac)|(.mp3)|(.ogg)$", "", track.title).strip()
+        if downloaded:
+            self.write_metadata(page_meta)
+        self.meta_loaded = True
+        VENUES.record_tape(self)
+        SONGS.record_tape(self)
         self.insert_breaks()
+        SCORES.record_meta(self)
         return
 
     def write_metadata(self, page_meta):
-        os.makedirs(os.path.dirname(self.meta_path), exist_ok=True)
-        json.dump(page_meta, open(self.meta_path, "w"), indent=2)
+        metadata_store(self.dbpath).put(self.identifier, page_meta)
         self.meta_loaded = True
 
-    def append_track(self, tdict, orig_titles={}, orig_tracks={}):
-        if not "original" in tdict.keys():  # This is not a valid track
-            return
-        name = tdict.get("name", "unknown")
-        if name.startswith("_78"):  # in the georgeblood collections, these are auxilliary tracks, to be ignored.
-            return
-        source = tdict["source"]
-        if source == "original":
-            orig = tdict["name"]
-            # orig = re.sub(r'(.flac)|(.mp3)|(.ogg)$','', orig)
-        else:
-            orig = tdict["original"]
-        if tdict.get("title", "unknown") == "unknown":
-            tdict["title"] = orig_titles.get(orig, None)
-        tdict["track"] = orig_tracks.get(orig, None)
-        for i, t in enumerate(self._tracks):  # loop over the _tracks we already have
-            if orig == t.original:  # add in alternate formats.
-                # make sure that this isn't a duplicate!!!
-                t.add_file(tdict)
-                return t  # don't append this, because we already have this _track
-        self._tracks.append(GDTrack(tdict, self.identifier))
+    def parse_files(self, files):
+        """Build the tracks from the files of an archive.org response, in one pass over the files.
+
+        The playable files are grouped by their original, and each track ranks its formats once. If the track numbers
+        of the originals are known (and distinct), the tracks are put in that order with one (stable) sort, followed by
+        any tracks without a number.
+        """
+        formats = self._lossy_formats if self.stream_only() else self._playable_formats
+        orig_titles = {}
+        orig_tracknums = {}
+        groups = {}  # original -> its playable files, in the order they are first seen
+        for ifile in files:
+            source = ifile["source"]
+            if source == "original":
+                title = ifile.get("title", "unknown")
+                orig_titles[ifile["name"]] = title if title != "unknown" else ifile["name"]
+                if ifile.get("track", None):
+                    orig_tracknums[ifile["name"]] = ifile["track"]
+            if ifile["format"] not in formats or "original" not in ifile:  # not a valid track
+                continue
+            if ifile.get("name", "unknown").startswith("_78"):  # in the georgeblood collections, these are auxilliary tracks
+                continue
+            groups.setdefault(ifile["name"] if source == "original" else ifile["original"], []).append(ifile)
+
+        tracks = []
+        for orig, group in groups.items():
+            tdict = dict(group[0], track=orig_tracknums.get(orig, None))
+            if tdict.get("title", "unknown") == "unknown":
+                tdict["title"] = orig_titles.get(orig, None)
+            track = GDTrack(tdict, self.identifier)
+            if len(group) > 1:  # add in alternate formats
+                track.files.extend(track.file_dict(f) for f in group[1:])
+                track.sort_files()
+            track.title = clean_title(track.title) if isinstance(track.title, str) else ""
+            tracks.append(track)
+
+        order = [(t.track is None, t.track or 0) for t in tracks]  # the unnumbered tracks go last, in file order
+        if order != sorted(order):
+            try:
+                distinct = len({int(v) for v in orig_tracknums.values()}) == len(orig_tracknums)
+            except ValueError:
+                distinct = False
+            if distinct:
+                tracks.sort(key=lambda t: (t.track is None, t.track or 0))
+        return tracks
 
     def venue(self, tracknum=0):
         """return the venue, city, state"""
@@ -2059,17 +4237,44 @@ class GDTape(BaseTape):
         try:
             venue_string = ""
             loc = sd.location
-            if tracknum > 0:  # only pull the metadata if the query is about a late track.
-                self.get_metadata()
-                breaks = self._compute_breaks()
-                if (len(breaks["location"]) > 0) and (tracknum > breaks["location"][0]):
-                    loc = sd.location2
+            if tracknum > 0:  # only look at the breaks if the query is about a late track.
+                breaks = self.break_map()
+                if breaks is not None and (len(breaks["location"]) > 0) and (tracknum > breaks["location"][0]):
+                    loc = breaks["location2"]
             venue_string = f"{loc[0]}, {loc[1]}, {loc[2]}"
         except:
             logger.warning(f"failed to get venue for tape id {self.identifier}")
             return self.identifier
         return venue_string
 
+    def break_map(self):
+        """The positions of the breaks (see _compute_breaks) and the second location, if there is one.
+
+        The map is kept in the metadata store, so it is only computed again when the metadata, the set data or the
+        formats of the tracks change. None if there is no stored map and the metadata can not be loaded.
+        """
+        sd = self.set_data if self.set_data is not None else GDDate_info([])
+        store = metadata_store(self.dbpath)
+        version = self.break_version()
+        breaks = store.get_breaks(self.identifier, version)
+        if breaks is None and not self.meta_loaded:
+            self.get_metadata()  # which stores the map, when it inserts the breaks
+            if not self.meta_loaded:
+                return None
+            breaks = store.get_breaks(self.identifier, version)
+        if breaks is None:
+            breaks = self._compute_breaks()
+            breaks["location2"] = list(sd.location2) if len(breaks["location"]) > 0 else None
+            store.put_breaks(self.identifier, version, breaks)
+        return breaks
+
+    def break_version(self):
+        """A checksum of what places the breaks, besides the metadata (whose writes drop the map): the set data, and the
+        formats which parse_files makes the tracks from, since the tracks differ with PLAY_LOSSLESS."""
+        sd = self.set_data if self.set_data is not None else GDDate_info([])
+        formats = self._lossy_formats if self.stream_only() else self._playable_formats
+        return zlib.crc32(repr((sd.version(), tuple(formats))).encode("utf-8"))
+
     def _compute_breaks(self):
         if not self.meta_loaded:
             self.get_metadata()
@@ -2090,10 +4295,11 @@ class GDTape(BaseTape):
         long_breaks = []
         short_breaks = []
         location_breaks = []
+        matcher = TitleMatcher(tlist)
         try:
-            long_breaks = [difflib.get_close_matches(x, tlist)[0] for x in lb]
-            short_breaks = [difflib.get_close_matches(x, tlist)[0] for x in sb]
-            location_breaks = [difflib.get_close_matches(x, tlist)[0] for x in locb]
+            long_breaks = [matcher.close_matches(x)[0] for x in lb]
+            short_breaks = [matcher.close_matches(x)[0] for x in sb]
+            location_breaks = [matcher.close_matches(x)[0] for x in locb]
         except Exception:
             pass
         # NOTE: Use the _last_ element here to handle sandwiches.
@@ -2111,10 +4317,12 @@ class GDTape(BaseTape):
     def insert_breaks(self, breaks=None, force=False):
         if not self.meta_loaded:
             self.get_metadata()
+        if not self.meta_loaded:  # the metadata could not be loaded, so there are no tracks to put breaks between
+            return
         if self._breaks_added and not force:
             return
         if not breaks:
-            breaks = self._compute_breaks()
+            breaks = self.break_map()
         longbreak_path = pkg_resources.resource_filename("timemachine.metadata", "silence600.ogg")
         breakd = {
             "track": -1,
@@ -2134,7 +4342,7 @@ class GDTape(BaseTape):
         # make the tracks
         newtracks = []
         tlist = [x.title for x in self._tracks]
-        set_breaks_already_in_tape = difflib.get_close_matches("Set Break", tlist, cutoff=0.6)
+        set_breaks_already_in_tape = TitleMatcher(tlist).close_matches("Set Break", cutoff=0.6)
         set_breaks_already_locs = [tlist.index(x) for x in set_breaks_already_in_tape]
         for i, t in enumerate(self._tracks):
             if i not in set_breaks_already_locs:
@@ -2166,17 +4374,13 @@ class GDTape(BaseTape):
 class GDTrack(BaseTrack):
     """A track from a GDTape recording"""
 
+    __slots__ = ("track", "original", "title", "files")
+
     def __init__(self, tdict, parent_id, break_track=False):
         super().__init__(tdict, parent_id, break_track)
         attribs = ["track", "original", "title"]
-
-        """ NOTE This should be part of the player, not part of the tape or track, as it is now """
-        if config.optd["PLAY_LOSSLESS"]:
-            self._playable_formats = ["Flac", "Shorten", "Ogg Vorbis", "VBR MP3", "MP3"]
-        else:
-            self._playable_formats = ["Ogg Vorbis", "VBR MP3", "MP3"]
-        self._lossy_formats = ["Ogg Vorbis", "VBR MP3", "MP3"]
-        """ ----------------------------------------------------------------------------------- """
+        self.track = None
+        self.original = None
 
         if "title" not in tdict.keys():
             tdict["title"] = tdict["name"] if "name" in tdict.keys() else "unknown"
@@ -2186,13 +4390,21 @@ class GDTrack(BaseTrack):
         if tdict["source"] == "original":
             self.original = tdict["name"]
         try:
-            self.track = int(self.track) if "track" in dir(self) and self.track is not None else None
+            self.track = int(self.track) if self.track is not None else None
         except ValueError:
             self.track = None
         self.files = []
         self.add_file(tdict, break_track)
 
-    def add_file(self, tdict, break_track=False):
+    @property
+    def _playable_formats(self):
+        return playable_formats()
+
+    @property
+    def _lossy_formats(self):
+        return LOSSY_FORMATS
+
+    def file_dict(self, tdict, break_track=False):
         attribs = ["name", "format", "size", "source", "path"]
         d = {k: v for (k, v) in tdict.items() if k in attribs}
         d["size"] = int(d["size"])
@@ -2200,8 +4412,15 @@ class GDTrack(BaseTrack):
             d["url"] = "https://archive.org/download/" + self.parent_id + "/" + d["name"]
         else:
             d["url"] = "file://" + os.path.join(d["path"], d["name"])
-        self.files.append(d)
-        self.files = sorted(self.files, key=lambda x: self._playable_formats.index(x["format"]))
+        return d
+
+    def add_file(self, tdict, break_track=False):
+        self.files.append(self.file_dict(tdict, break_track))
+        self.sort_files()
+
+    def sort_files(self):
+        rank = FORMAT_RANK[self._playable_formats]
+        self.files.sort(key=lambda x: rank[x["format"]])
 
 
 class GDSet_row:
@@ -2244,6 +4463,7 @@ class GDDate_info:
         self.shortbreaks = []
         self.location = ()
         self.n_locations = 0
+        self.start_time = next((row.start_time for row in set_rows if row.start_time), None)
         for row in set_rows:
             prevsong = ""
             if int(row.ievent) == 1:
@@ -2259,6 +4479,11 @@ class GDDate_info:
             if row.break_length == "short":
                 self.shortbreaks.append(row.song)
 
+    def version(self):
+        """A checksum of the set data which places the breaks, to tell when a stored break map is stale"""
+        breaks = (self.longbreaks, self.shortbreaks, self.locationbreak, getattr(self, "location2", None))
+        return zlib.crc32(repr(breaks).encode("utf-8"))
+
     def __repr__(self):
         retstr = (
             f"{self.date} {self.location} -- {self.n_sets} Rows. Long breaks:{self.longbreaks}. Short breaks {self.shortbreaks}"
@@ -2266,26 +4491,119 @@ class GDDate_info:
         return retstr
 
 
+class SetBreaksStore:
+    """The set lists of set_breaks.csv, compiled once into a pickle in the user's cache dir, and shared by the whole process.
+
+    The rows are kept as tuples, keyed by (artist, date). A GDDate_info is built the first time a date is asked for,
+    and kept. Every date without set data shares one empty GDDate_info.
+    The pickle is named for the size and mtime of the csv, so a new csv gets a new pickle. It is compiled when the
+    timemachine is installed (see update.sh), or at first use if it is missing.
+    """
+
+    VERSION = 1
+
+    def __init__(self, csv_path=None, cache_dir=None):
+        self.csv_path = csv_path or pkg_resources.resource_filename("timemachine.metadata", "set_breaks.csv")
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "timemachine")
+        self.fields = ()
+        self._rows = None  # (artist, date) -> tuple of rows (tuples of fields)
+        self._date_info = {}
+        self._lock = Lock()
+        self.empty = GDDate_info([])
+
+    def source_stamp(self):
+        stat = os.stat(self.csv_path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    @property
+    def pickle_path(self):
+        size, mtime = self.source_stamp()
+        return os.path.join(self.cache_dir, f"set_breaks.{size}.{mtime}.pickle")
+
+    def remove_stale(self, pickle_path):
+        """Remove the pickles of older csv files from the cache dir"""
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith("set_breaks.") and name.endswith(".pickle") and path != pickle_path:
+                os.remove(path)
+
+    def compile(self):
+        """Parse the csv and write the pickle. Returns the compiled store."""
+        with open(self.csv_path, "r", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            fields = tuple(next(reader))
+            i_artist, i_date = fields.index("artist"), fields.index("date")
+            rows = {}
+            for row in reader:
+                row = tuple(sys.intern(x) for x in row)
+                rows.setdefault((row[i_artist], row[i_date]), []).append(row)
+        store = {"version": self.VERSION, "source": self.source_stamp(), "fields": fields}
+        store["rows"] = {k: tuple(v) for k, v in rows.items()}
+        pickle_path = self.pickle_path
+        try:
+            os.makedirs(os.path.dirname(pickle_path), exist_ok=True)
+            with open(pickle_path + ".tmp", "wb") as f:
+                pickle.dump(store, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(pickle_path + ".tmp", pickle_path)
+            self.remove_stale(pickle_path)
+        except OSError as e:
+            logger.warning(f"Failed to write {pickle_path}: {e}")
+        return store
+
+    def read(self):
+        try:
+            with open(self.pickle_path, "rb") as f:
+                store = pickle.load(f)
+            if store["version"] == self.VERSION and tuple(store["source"]) == self.source_stamp():
+                return store
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError, ValueError):
+            pass
+        logger.info(f"Compiling {self.csv_path}")
+        return self.compile()
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            with self._lock:
+                if self._rows is None:
+                    store = self.read()
+                    self.fields = store["fields"]
+                    self._rows = store["rows"]
+        return self._rows
+
+    def set_rows(self, artist, date):
+        return [GDSet_row(dict(zip(self.fields, row))) for row in self.rows.get((artist, date), ())]
+
+    def iter_rows(self):
+        """Every row, as a GDSet_row"""
+        for rows in self.rows.values():
+            for row in rows:
+                yield GDSet_row(dict(zip(self.fields, row)))
+
+    def dates(self, artist):
+        return [date for a, date in self.rows if a == artist]
+
+    def get_date(self, artist, date):
+        info = self._date_info.get((artist, date))
+        if info is None:
+            info = GDDate_info(self.set_rows(artist, date)) if (artist, date) in self.rows else self.empty
+            self._date_info[(artist, date)] = info
+        return info
+
+
+SET_BREAKS = SetBreaksStore()
+
+
 class GDSetBreaks:
-    """Set Information from a Grateful Dead date"""
+    """Set Information from a Grateful Dead date. A view of the process-wide SET_BREAKS."""
 
     def __init__(self, collection_list):
         self.collection_list = collection_list
         self.asd = {}
-        self.set_rows = []
-        # if 'GratefulDead' not in self.collection_list:
-        #    self.set_data = set_data
-        #    return
-        set_breaks = pkg_resources.resource_stream("timemachine.metadata", "set_breaks.csv")
-        utf8_reader = codecs.getreader("utf-8")
-        r = [r for r in csv.reader(utf8_reader(set_breaks))]
-        headers = r[0]
-        for row in r[1:]:
-            d = dict(zip(headers, row))
-            current_row = GDSet_row(d)
-            self.set_rows.append(current_row)
+        self.store = SET_BREAKS
 
-        # self.set_data = set_data
+    def iter_rows(self):
+        return self.store.iter_rows()
 
     def __str__(self):
         return self.__repr__()
@@ -2295,21 +4613,12 @@ class GDSetBreaks:
         return retstr
 
     def get_artist_set_dict(self, artist):
-        if artist in self.asd.keys():
-            return self.asd[artist]
-
-        self.asd[artist] = {}
-        artist_rows = [sd for sd in self.set_rows if sd.artist == artist]
-        for s in artist_rows:
-            if not s.date in self.asd[artist].keys():
-                self.asd[artist][s.date] = [s]
-            else:
-                self.asd[artist][s.date].append(s)
-
+        if artist not in self.asd.keys():
+            self.asd[artist] = {date: self.store.set_rows(artist, date) for date in self.store.dates(artist)}
         return self.asd[artist]
 
     def get_date(self, artist, date):
-        return GDDate_info(self.get_artist_set_dict(artist).get(date, []))
+        return self.store.get_date(artist, date)
 
     def multi_location(self, artist, date):
         d = self.get_date(artist, date)
@@ -135,6 +135,10 @@ fi
 
 system "pip3 install --no-deps --force-reinstall git+https://github.com/eichblatt/deadstream.git@$git_branch"
 
+# Compile the set breaks into ~/.cache/timemachine, so the timemachine does not parse the csv when it starts.
+echo "python3 -c 'from timemachine import Archivary; Archivary.SET_BREAKS.compile()'"
+python3 -c 'from timemachine import Archivary; Archivary.SET_BREAKS.compile()'
+
 new_metadata_path=$HOME/$env_name/$timemachine_path/metadata
 
 # Copy the metadata
@@ -80,6 +80,11 @@ def default_options():
     d["DEFAULT_START_TIME"] = datetime.time(15, 0)
     d["TIMEZONE"] = "America/New_York"
     d["PLEX_SERVERS"] = []
+    d["LOAD_WORKERS"] = 0  # processes used to load the archive. 0 means one per core
+    d["PAGE_YEARS"] = False  # keep only the tapes of the years around the year knob built
+    d["TAPE_MEMORY_BUDGET_MB"] = 0  # MB of built tapes to keep in memory, as estimated per tape and track. 0 means no limit
+    d["METADATA_QUOTA_MB"] = 100  # MB of disk for the metadata of tapes. 0 means no limit
+    d["BAD_TAPE_TTL_DAYS"] = 30  # days to skip a tape which could not be played, before trying it again
     return d
 
 
@@ -165,6 +170,7 @@ def load_options():
                     "ON_TOUR_ALLOWED",
                     "BLUETOOTH_ENABLE",
                     "UPDATE_ARCHIVE_ON_STARTUP",
+                    "PAGE_YEARS",
                 ]:  # make booleans.
                     tmpd[k] = tmpd[k].lower() == "true"
                     logger.debug(f"Booleans k is {k}")
@@ -178,6 +184,8 @@ def load_options():
                     tmpd[k] = c
                 if k in ["PLEX_SERVERS"]:
                     tmpd[k] = normalize_plex_servers(tmpd[k])
+                if k in ["LOAD_WORKERS", "TAPE_MEMORY_BUDGET_MB", "METADATA_QUOTA_MB", "BAD_TAPE_TTL_DAYS"]:  # integers
+                    tmpd[k] = int(tmpd[k])
                 if k in ["DEFAULT_START_TIME"]:  # make datetime
                     logger.debug(f"time k is {k}")
                     tmpd[k] = datetime.time.fromisoformat(tmpd[k])
@@ -19,7 +19,6 @@ import logging
 import os
 import string
 import subprocess
-from bisect import bisect
 from threading import BoundedSemaphore, Event
 from time import sleep
 from typing import Callable
@@ -215,6 +214,7 @@ class date_knob_reader:
         self.d = d
         self.maxd = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]  # max days in a month.
         self.year_baseline = 1965 if archive is None else min(archive.year_list())
+        self._paged_year = None
         self._update()
 
     def __str__(self):
@@ -246,12 +246,15 @@ class date_knob_reader:
             d_val = d_val - 1
             self.date = datetime.date(y_val, m_val, d_val)
         logger.debug(f"date reader date {self.date}")
+        if y_val != self._paged_year and hasattr(self.archive, "ensure_year"):
+            self._paged_year = y_val
+            self.archive.ensure_year(y_val)  # page in the tapes of a paged archive for the new year
 
     def set_date(self, date, shownum=0):
         new_month, new_day, new_year = (date.month, date.day, date.year)
         self.m.steps = new_month
         self.d.steps = new_day
-        self.y.steps = new_year - min((self.archive).year_list())
+        self.y.steps = new_year - self.archive.year_list()[0]
         self.shownum = divmod(shownum, max(1, len(self.shows_available())))[1]
         self._update()
 
@@ -273,11 +276,7 @@ class date_knob_reader:
         if self.archive is None:
             return []
         self._update()
-        if self.fmtdate() in self.archive.tape_dates.keys():
-            shows = [t.artist for t in self.archive.tape_dates[self.fmtdate()]]
-            return list(dict.fromkeys(shows))
-        else:
-            return []
+        return list(self.archive.artists_on(self.fmtdate()))
 
     def tape_available(self):
         return len(self.shows_available()) > 0
@@ -286,16 +285,13 @@ class date_knob_reader:
         if self.archive is None:
             return None
         self._update()
-        current_index = bisect(self.archive.dates, self.fmtdate())
-        for d in self.archive.dates[current_index:] + self.archive.dates[:current_index]:
-            artists = [t.artist for t in self.archive.tape_dates[d]]
-            artists = list(dict.fromkeys(artists))  # make it the unique set
-            if not artist in artists:
-                continue
-            shownum = artists.index(artist)
-            logger.debug(f" artist is {artist}. artists: {artists}. date {d}. Shownum {shownum}")
-            return (datetime.datetime.fromisoformat(d).date(), shownum)
-        return None
+        d = self.archive.next_artist_date(artist, self.fmtdate())
+        if d is None:
+            return None
+        artists = self.archive.artists_on(d)  # the unique set
+        shownum = artists.index(artist) if artist in artists else 0
+        logger.debug(f" artist is {artist}. artists: {artists}. date {d}. Shownum {shownum}")
+        return (datetime.datetime.fromisoformat(d).date(), shownum)
 
     def next_show(self):
         if self.archive is None:
@@ -310,10 +306,8 @@ class date_knob_reader:
         if self.archive is None:
             return None
         self._update()
-        current_index = bisect(self.archive.dates, self.fmtdate())
-        for d in self.archive.dates[current_index:] + self.archive.dates[:current_index]:
-            return datetime.datetime.fromisoformat(d).date()
-        return self.date
+        next_date = self.archive.calendar.next_date(self.date)
+        return self.date if next_date is None else next_date
 
 
 class decade_counter:
@@ -526,17 +526,10 @@ def year_button(button, state):
     y = state.date_reader.date.year
 
     if m == now_m and d == now_d:  # move to the next year where there is a tape available
-        tihstring = f"{m:0>2d}-{d:0>2d}"
-        tih_tapedates = [to_date(d) for d in state.date_reader.archive.dates if d.endswith(tihstring)]
-        if len(tih_tapedates) > 0:
-            cut = 0
-            for i, dt in enumerate(tih_tapedates):
-                if dt.year > y:
-                    cut = i
-                    break
-            tapedate = (tih_tapedates[cut:] + tih_tapedates[:cut])[0]
-            logger.debug(f"tapedate is {tapedate}")
-            state.date_reader.set_date(datetime.date(tapedate.year, now_m, now_d))
+        year = state.date_reader.archive.calendar.next_year_on(m, d, y)
+        if year is not None:
+            logger.debug(f"tapedate is {year}-{m:0>2d}-{d:0>2d}")
+            state.date_reader.set_date(datetime.date(year, now_m, now_d))
     else:
         state.date_reader.set_date(datetime.date(y, now_m, now_d))
     stagedate_event.set()
@@ -908,12 +901,34 @@ def _select_with_year_knob(title, options):
         sleep(0.01)
 
 
+def _search_venue(archive):
+    """Spell a venue or city with the Year knob, then choose one of its dates. Returns the date, or None."""
+    prefix = ""
+    places = {}
+    while True:
+        chars = Archivary.VENUES.next_chars(prefix)
+        if prefix:
+            places = archive.venue_search(prefix)
+            if len(places) <= MENU_VISIBLE_ITEMS * 4 or len(chars) == 0:
+                break
+        selection = _select_with_year_knob(f"Venue:{prefix}", ["Cancel"] + [prefix + c for c in chars])
+        if selection in [None, "Cancel"]:
+            return None
+        prefix = selection
+    place = _select_with_year_knob(prefix, ["Cancel"] + list(places.keys()))
+    if place in [None, "Cancel"]:
+        return None
+    date = _select_with_year_knob(place[:14], ["Cancel"] + places[place])
+    return None if date in [None, "Cancel"] else to_date(date)
+
+
 def run_month_menu(current_state):
     global MENU_ACTIVE, MENU_SUPPRESS_UNTIL
     resume_playback_on_exit = False
     shutdown_or_restart = False
     launched_update = False
     original_date = current_state.date_reader.date
+    chosen_date = None
     original_steps = TMB.y.steps
     saved_screen = TMB.scr.image.tobytes()
 
@@ -930,10 +945,16 @@ def run_month_menu(current_state):
             resume_playback_on_exit = True
 
         while True:
-            selection = _select_with_year_knob("Menu", ["Cancel", "Update code", "Shutdown", "Restart", "Info"])
+            selection = _select_with_year_knob("Menu", ["Cancel", "Venue", "Update code", "Shutdown", "Restart", "Info"])
             if selection in [None, "Cancel"]:
                 break
 
+            if selection == "Venue":
+                chosen_date = _search_venue(current_state.date_reader.archive)
+                if chosen_date is None:
+                    continue
+                break
+
             if selection == "Update code":
                 launched_update = True
                 TMB.scr.clear()
@@ -964,7 +985,7 @@ def run_month_menu(current_state):
                 break
     finally:
         TMB.y.steps = original_steps
-        current_state.date_reader.set_date(original_date)
+        current_state.date_reader.set_date(chosen_date if chosen_date else original_date)
         if resume_playback_on_exit and not shutdown_or_restart and not launched_update:
             current = current_state.get_current()
             if current["PLAY_STATE"] == config.PAUSED:
@@ -979,6 +1000,8 @@ def run_month_menu(current_state):
         if not shutdown_or_restart and not launched_update:
             TMB.scr.image.frombytes(saved_screen)
             TMB.scr.refresh(force=True)
+        if chosen_date:
+            stagedate_event.set()
         free_event.set()
 
 
@@ -1031,7 +1054,9 @@ archive = Archivary.Archivary(
     with_latest=False,
     collection_list=config.optd["COLLECTIONS"],
     date_range=date_range,
+    paged=config.optd.get("PAGE_YEARS", False),
 )
+archive.start_migration()
 player = GD.GDPlayer()
 if config.optd["PULSEAUDIO_ENABLE"]:
     logger.debug("Setting Audio device to pulse")
@@ -203,6 +203,7 @@ def shuffle_artist(state):
         collection_list=config.optd["COLLECTIONS"],
         date_range=date_range,
     )
+    date_reader.archive.start_migration()
     artist_year_dict = date_reader.archive.year_artists(*config.DATE_RANGE)
     # artist_year_dict = archive.year_artists(date.year, config.OTHER_YEAR)
     artist_list = sorted(list(artist_year_dict.keys()))
@@ -1,5 +1,6 @@
 from time import sleep
 import difflib
+import html
 import os
 import optparse
 import logging
@@ -9,7 +10,7 @@ import subprocess
 
 import pulsectl
 
-from timemachine import bluetoothctl, config
+from timemachine import Archivary, bluetoothctl, config
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 OS_VERSION = None
@@ -50,6 +51,7 @@ if parms.debug:
     logger.setLevel(logging.DEBUG)
 
 
+venues = None
 bt = None
 bt_devices = []
 bt_connected = None
@@ -177,6 +179,16 @@ def disable_pulse():
         logger.warning("Pulse audio still working on this machine")
 
 
+def get_venues():
+    """The venue index of the time machine, read from its metadata the first time it is needed"""
+    global venues
+    if venues is None:
+        venues = Archivary.VenueIndex()
+        venues.load(os.path.join(Archivary.ROOT_DIR, "metadata"))
+        venues.add_set_rows(Archivary.GDSetBreaks([]).iter_rows())
+    return venues
+
+
 class OptionsServer(object):
     @cherrypy.expose
     def index(self):
@@ -248,6 +260,9 @@ class OptionsServer(object):
                      <form method="get" action="plex_servers_settings">
                          <button type="submit">Plex Servers</button>
                      </form>
+           <form method="get" action="venue_search">
+             <button type="submit">Search Venues</button>
+           </form>
            <form method="get" action="restart_tm_service">
              <button type="submit">Restart Timemachine Service</button>
            </form>
@@ -500,6 +515,31 @@ class OptionsServer(object):
         """
         return page_string
 
+    @cherrypy.expose
+    def venue_search(self, query=""):
+        results = get_venues().search(query) if query else {}
+        row_html = [f"<li>{html.escape(place)}: {', '.join(dates)}</li>" for place, dates in results.items()]
+        page_string = f"""
+        <html>
+         <head></head>
+         <body>
+           <h1>Venue Search</h1>
+           <form method="get" action="venue_search">
+             <input type="text" name="query" value="{html.escape(query)}">
+             <button type="submit">Search</button>
+           </form>
+           <p>{len(results)} places</p>
+           <ul>
+             {''.join(row_html)}
+           </ul>
+           <form method="get" action="index">
+             <button type="submit">Return</button>
+           </form>
+         </body>
+        </html>
+        """
+        return page_string
+
     @cherrypy.expose
     def plex_servers_settings(self, message=""):
         return self.render_plex_servers_page(message=message)
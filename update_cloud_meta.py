@@ -145,7 +145,8 @@ def main(args):
         dbpath = os.path.dirname(archive.dbpath)
         if isinstance(metadir, list):
             metadir = metadir[0]
-        local_path = [os.path.join(metadir, x) for x in sorted(os.listdir(metadir))][-1]  # latest only
+        archive.downloader.compact_journal(metadir)  # upload whole period files, not the journal
+        local_path = [os.path.join(metadir, x) for x in sorted(os.listdir(metadir)) if x.endswith(".json")][-1]  # latest only
         cloud_path = local_path.replace(f"{dbpath}/", "")
         logger.info(f"path: {local_path}, cloud_path: {cloud_path}")
         obj = json.load(open(local_path, "r"))